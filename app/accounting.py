@@ -0,0 +1,211 @@
+import argparse
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+from sqlalchemy import func, case
+from .models import CandidateCost
+
+logger = logging.getLogger(__name__)
+
+OUTCOMES = ("accepted", "duplicate", "filtered", "failed")
+
+class CostLedger:
+    """Tokens, bytes and time spent on one candidate URL (or on a run's shared overhead when url is None)"""
+
+    def __init__(self, url: str = None, source_query: str = None):
+        self.url = url
+        self.source_query = source_query
+        self.tokens: Dict[str, list] = {}  # call site -> [prompt tokens, completion tokens]
+        self.stage_seconds: Dict[str, float] = {}
+        self.http_bytes = 0
+        self.stage_bytes: Dict[str, int] = {}
+        self.outcome: Optional[str] = None
+        self.reason: Optional[str] = None
+        self.lead_id = None
+
+    def add_tokens(self, call_site: str, prompt_tokens: int, completion_tokens: int) -> None:
+        counts = self.tokens.setdefault(call_site, [0, 0])
+        counts[0] += prompt_tokens or 0
+        counts[1] += completion_tokens or 0
+
+    def add_time(self, stage_name: str, seconds: float) -> None:
+        self.stage_seconds[stage_name] = self.stage_seconds.get(stage_name, 0.0) + seconds
+
+    def add_bytes(self, stage_name: str, count: int) -> None:
+        self.http_bytes += count
+        self.stage_bytes[stage_name] = self.stage_bytes.get(stage_name, 0) + count
+
+    def finish(self, outcome: str, reason: str = None, lead_id=None) -> None:
+        """Set the outcome once; later calls keep the first (most specific) result"""
+        if self.outcome is None:
+            self.outcome = outcome
+            self.reason = reason
+            self.lead_id = lead_id
+
+_current: ContextVar = ContextVar("cost_ledger", default=None)
+_stage: ContextVar = ContextVar("cost_stage", default=None)  # Innermost stage, for tagging downloads
+
+@contextmanager
+def charging(ledger: Optional[CostLedger]):
+    """Attribute LLM usage, downloads and stage times in this block to ledger"""
+    token = _current.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _current.reset(token)
+
+@contextmanager
+def stage(name: str):
+    started = time.monotonic()
+    token = _stage.set(name)
+    try:
+        yield
+    finally:
+        _stage.reset(token)
+        ledger = _current.get()
+        if ledger is not None:
+            ledger.add_time(name, time.monotonic() - started)
+
+def split_time(ledgers: Iterable[CostLedger], stage_name: str, seconds: float) -> None:
+    """Share a batch step's time (parsing, scoring) evenly between the candidates in the batch"""
+    ledgers = [ledger for ledger in ledgers if ledger is not None]
+    for ledger in ledgers:
+        ledger.add_time(stage_name, seconds / len(ledgers))
+
+def record_usage(call_site: str, completion) -> None:
+    ledger = _current.get()
+    usage = getattr(completion, "usage", None)
+    if ledger is not None and usage is not None:
+        ledger.add_tokens(call_site, getattr(usage, "prompt_tokens", 0), getattr(usage, "completion_tokens", 0))
+
+def record_bytes(count: int) -> None:
+    ledger = _current.get()
+    if ledger is not None:
+        ledger.add_bytes(_stage.get() or "other", count)
+
+def save_costs(session, run_id: str, user_id, ledgers: Iterable[CostLedger]) -> int:
+    now = datetime.utcnow()
+    count = 0
+    for ledger in ledgers:
+        session.add(CandidateCost(
+            run_id=run_id,
+            user_id=user_id,
+            url=ledger.url,
+            source_query=ledger.source_query,
+            outcome=ledger.outcome or ("overhead" if ledger.url is None else "failed"),
+            reason=ledger.reason,
+            lead_id=ledger.lead_id,
+            prompt_tokens=sum(counts[0] for counts in ledger.tokens.values()),
+            completion_tokens=sum(counts[1] for counts in ledger.tokens.values()),
+            http_bytes=ledger.http_bytes,
+            wall_seconds=round(sum(ledger.stage_seconds.values()), 4),
+            tokens=ledger.tokens,
+            stage_seconds={name: round(seconds, 4) for name, seconds in ledger.stage_seconds.items()},
+            stage_bytes=ledger.stage_bytes,
+            created_at=now
+        ))
+        count += 1
+    return count
+
+def new_run_id() -> str:
+    return uuid.uuid4().hex
+
+def cost_report(db, group_by: str = "user", user_id=None, since: datetime = None, until: datetime = None) -> list:
+    """Totals per user or per run, including the cost per accepted lead"""
+    key = CandidateCost.user_id if group_by == "user" else CandidateCost.run_id
+    columns = [
+        key.label("key"),
+        func.count(func.distinct(CandidateCost.run_id)).label("runs"),
+        func.min(CandidateCost.created_at).label("first_at"),
+        func.sum(case((CandidateCost.url.isnot(None), 1), else_=0)).label("candidates"),
+    ] + [
+        func.sum(case((CandidateCost.outcome == outcome, 1), else_=0)).label(outcome) for outcome in OUTCOMES
+    ] + [
+        func.sum(CandidateCost.prompt_tokens).label("prompt_tokens"),
+        func.sum(CandidateCost.completion_tokens).label("completion_tokens"),
+        func.sum(CandidateCost.http_bytes).label("http_bytes"),
+        func.sum(CandidateCost.wall_seconds).label("wall_seconds"),
+    ]
+    query = db.query(*columns)
+    if user_id is not None:
+        query = query.filter(CandidateCost.user_id == uuid.UUID(str(user_id)))
+    if since is not None:
+        query = query.filter(CandidateCost.created_at >= since)
+    if until is not None:
+        query = query.filter(CandidateCost.created_at < until)
+
+    report = []
+    for row in query.group_by(key).order_by(func.min(CandidateCost.created_at)):
+        entry = dict(row._mapping)
+        accepted = entry["accepted"] or 0
+        tokens = (entry["prompt_tokens"] or 0) + (entry["completion_tokens"] or 0)
+        entry["tokens_per_lead"] = round(tokens / accepted) if accepted else None
+        entry["kb_per_lead"] = round((entry["http_bytes"] or 0) / 1024 / accepted, 1) if accepted else None
+        entry["seconds_per_lead"] = round((entry["wall_seconds"] or 0) / accepted, 2) if accepted else None
+        report.append(entry)
+    return report
+
+def breakdown(db, user_id=None, since: datetime = None, until: datetime = None) -> Dict[str, dict]:
+    """Tokens per LLM call site, and seconds and HTTP bytes per stage, across the selection"""
+    query = db.query(CandidateCost.tokens, CandidateCost.stage_seconds, CandidateCost.stage_bytes)
+    if user_id is not None:
+        query = query.filter(CandidateCost.user_id == uuid.UUID(str(user_id)))
+    if since is not None:
+        query = query.filter(CandidateCost.created_at >= since)
+    if until is not None:
+        query = query.filter(CandidateCost.created_at < until)
+
+    tokens: Dict[str, list] = {}
+    seconds: Dict[str, float] = {}
+    downloaded: Dict[str, int] = {}
+    for row_tokens, row_seconds, row_bytes in query.yield_per(1000):
+        for site, (prompt_tokens, completion_tokens) in (row_tokens or {}).items():
+            counts = tokens.setdefault(site, [0, 0])
+            counts[0] += prompt_tokens
+            counts[1] += completion_tokens
+        for name, value in (row_seconds or {}).items():
+            seconds[name] = seconds.get(name, 0.0) + value
+        for name, value in (row_bytes or {}).items():
+            downloaded[name] = downloaded.get(name, 0) + value
+    return {"tokens": tokens, "stage_seconds": seconds, "stage_bytes": downloaded}
+
+def main():
+    parser = argparse.ArgumentParser(description="Report what candidates and accepted leads cost")
+    parser.add_argument("--by", choices=["user", "run"], default="user")
+    parser.add_argument("--user", help="Only this user (user_id)")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="From this ISO date/time (UTC)")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="Before this ISO date/time (UTC)")
+    args = parser.parse_args()
+
+    from .database import SessionLocal
+    db = SessionLocal()
+    try:
+        report = cost_report(db, args.by, args.user, args.since, args.until)
+        header = f"{args.by:<36} {'runs':>5} {'cands':>6} {'acc':>4} {'dup':>4} {'filt':>5} {'fail':>5} {'tok in':>9} {'tok out':>8} {'MB':>7} {'secs':>8} {'tok/lead':>9} {'s/lead':>7}"
+        print(header)
+        for entry in report:
+            print(f"{str(entry['key']):<36} {entry['runs']:>5} {entry['candidates']:>6} {entry['accepted']:>4} {entry['duplicate']:>4} "
+                  f"{entry['filtered']:>5} {entry['failed']:>5} {entry['prompt_tokens'] or 0:>9} {entry['completion_tokens'] or 0:>8} "
+                  f"{(entry['http_bytes'] or 0) / 1048576:>7.2f} {entry['wall_seconds'] or 0:>8.1f} "
+                  f"{entry['tokens_per_lead'] if entry['tokens_per_lead'] is not None else '-':>9} "
+                  f"{entry['seconds_per_lead'] if entry['seconds_per_lead'] is not None else '-':>7}")
+
+        parts = breakdown(db, args.user, args.since, args.until)
+        print("\nTokens by call site (in / out):")
+        for site, (prompt_tokens, completion_tokens) in sorted(parts["tokens"].items(), key=lambda item: -sum(item[1])):
+            print(f"  {site:<14} {prompt_tokens:>10} / {completion_tokens}")
+        print("\nSeconds by stage:")
+        for name, seconds in sorted(parts["stage_seconds"].items(), key=lambda item: -item[1]):
+            print(f"  {name:<14} {seconds:>10.1f}")
+        print("\nMB downloaded by stage:")
+        for name, count in sorted(parts["stage_bytes"].items(), key=lambda item: -item[1]):
+            print(f"  {name:<14} {count / 1048576:>10.2f}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+import argparse
+import csv
+import json
+import logging
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List, Optional
+from ratelimit import limits, sleep_and_retry
+from sqlalchemy import func
+from .database import SessionLocal, init_db
+from .models import User, Product, ICP
+from .config import settings
+from .onboarding import analyze_product_for_icp
+from .db_writer import write, close_writer
+
+logger = logging.getLogger(__name__)
+
+EMAIL_PATTERN = re.compile(r"[^@]+@[^@]+\.[^@]+")
+REQUIRED_FIELDS = ("name", "email", "company_name", "industry", "product_name", "product_description", "geography")
+
+@sleep_and_retry
+@limits(calls=settings.groq_requests_per_minute, period=60)
+def rate_limited_analysis(product_name: str, product_desc: str) -> Optional[dict]:
+    """analyze_product_for_icp, blocking while the shared per-minute limit is used up"""
+    return analyze_product_for_icp(product_name, product_desc)
+
+def split_list(value) -> List[str]:
+    """Accept JSON lists or comma/semicolon separated strings"""
+    if value is None:
+        return []
+    if isinstance(value, list):
+        items = value
+    else:
+        items = re.split(r"[;,]", str(value))
+    return [str(item).strip() for item in items if str(item).strip()]
+
+def read_rows(path: str) -> List[dict]:
+    """Read accounts from a .csv (header row) or .jsonl file"""
+    rows = []
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            for line, row in enumerate(csv.DictReader(f), start=2):
+                rows.append({**row, "line": line})  # A "line" column can't override the reported line
+        else:
+            for line, text in enumerate(f, start=1):
+                if not text.strip():
+                    continue
+                try:
+                    record = json.loads(text)
+                except ValueError as e:
+                    rows.append({"line": line, "parse_error": f"Invalid JSON: {str(e)}"})
+                    continue
+                if isinstance(record, dict):
+                    rows.append({**record, "line": line})
+                else:
+                    rows.append({"line": line, "parse_error": f"Expected a JSON object, got {type(record).__name__}"})
+    return rows
+
+def validate_row(row: dict) -> Optional[str]:
+    if "parse_error" in row:
+        return row["parse_error"]
+    missing = [field for field in REQUIRED_FIELDS if not str(row.get(field) or "").strip()]
+    if missing:
+        return f"Missing {', '.join(missing)}"
+    not_text = [field for field in REQUIRED_FIELDS + ("website",) if row.get(field) is not None and not isinstance(row[field], str)]
+    if not_text:
+        return f"Not text: {', '.join(not_text)}"
+    if not EMAIL_PATTERN.match(row["email"].strip()):
+        return f"Invalid email {row['email']}"
+    return None
+
+def existing_emails(db, emails: List[str]) -> set:
+    """Lowercased emails that already have an account, compared case-insensitively like the in-file check"""
+    emails = [email.lower() for email in emails]
+    found = set()
+    for i in range(0, len(emails), 500):
+        chunk = emails[i:i + 500]
+        found.update(email.lower() for (email,) in db.query(User.email).filter(func.lower(User.email).in_(chunk)))
+    return found
+
+def build_account(row: dict, analysis: Optional[dict]) -> dict:
+    """Merge a row with its ICP analysis; explicit values in the row win over suggestions"""
+    pain_points = split_list(row.get("target_pain_points")) or (analysis or {}).get("pain_points", [])
+    industries = split_list(row.get("target_industries")) or (analysis or {}).get("industries", [])
+    return {
+        "user_id": uuid.uuid4(),
+        "name": row["name"].strip(),
+        "email": row["email"].strip(),
+        "company_name": row["company_name"].strip(),
+        "website": (row.get("website") or "").strip() or None,
+        "industry": row["industry"].strip(),
+        "product_name": row["product_name"].strip(),
+        "product_description": row["product_description"].strip(),
+        "target_industries": industries,
+        "target_pain_points": pain_points,
+        "geography": row["geography"].strip()
+    }
+
+def add_accounts(session, accounts: List[dict]) -> int:
+    for account in accounts:
+        session.add(User(
+            user_id=account["user_id"],
+            name=account["name"],
+            email=account["email"],
+            company_name=account["company_name"],
+            website=account["website"],
+            industry=account["industry"]
+        ))
+        session.add(Product(
+            user_id=account["user_id"],
+            name=account["product_name"],
+            description=account["product_description"]
+        ))
+        session.add(ICP(
+            user_id=account["user_id"],
+            target_industries=account["target_industries"],
+            target_pain_points=account["target_pain_points"],
+            geography=account["geography"]
+        ))
+    return len(accounts)
+
+def insert_accounts(accounts: List[dict], report: Dict[int, dict]) -> None:
+    """Insert in chunked transactions, retrying a failed chunk row by row to isolate bad rows"""
+    size = settings.onboarding_batch_size
+    for i in range(0, len(accounts), size):
+        chunk = accounts[i:i + size]
+        try:
+            write(partial(add_accounts, accounts=[account for _, account in chunk]))
+            for line, account in chunk:
+                report[line].update(status="created", user_id=str(account["user_id"]))
+        except Exception as e:
+            logger.info(f"Insert of {len(chunk)} accounts failed ({str(e)}), retrying individually")
+            for line, account in chunk:
+                try:
+                    write(partial(add_accounts, accounts=[account]))
+                    report[line].update(status="created", user_id=str(account["user_id"]))
+                except Exception as row_error:
+                    report[line].update(status="failed", error=f"Insert failed: {str(row_error)}")
+
+def bulk_onboard(rows: List[dict]) -> List[dict]:
+    """Validate, analyze and insert accounts; returns one report entry per input row"""
+    report = {row["line"]: {"line": row["line"], "email": row.get("email"), "status": "pending", "error": ""} for row in rows}
+    valid = []
+    seen = set()
+    for row in rows:
+        error = validate_row(row)
+        email = str(row.get("email") or "").strip().lower()
+        if error is None and email in seen:
+            error = "Duplicate email in file"
+        if error:
+            report[row["line"]].update(status="failed", error=error)
+            continue
+        seen.add(email)
+        valid.append(row)
+
+    db = SessionLocal()
+    try:
+        taken = existing_emails(db, [row["email"].strip() for row in valid])
+    finally:
+        db.close()
+    pending = []
+    for row in valid:
+        if row["email"].strip().lower() in taken:
+            report[row["line"]].update(status="skipped", error="User already exists")
+        else:
+            pending.append(row)
+
+    # Rows that already carry pain points and industries don't need the LLM
+    needs_analysis = [row for row in pending if not (split_list(row.get("target_pain_points")) and split_list(row.get("target_industries")))]
+    logger.info(f"Onboarding {len(pending)} accounts, {len(needs_analysis)} need ICP analysis")
+
+    analyses = {}
+    with ThreadPoolExecutor(max_workers=settings.onboarding_workers, thread_name_prefix="onboarding") as executor:
+        futures = {
+            row["line"]: executor.submit(rate_limited_analysis, row["product_name"].strip(), row["product_description"].strip())
+            for row in needs_analysis
+        }
+        for line, future in futures.items():
+            try:
+                analyses[line] = future.result()
+            except Exception as e:
+                logger.error(f"Error analyzing product on line {line}: {str(e)}")
+                analyses[line] = None
+
+    accounts = []
+    for row in pending:
+        account = build_account(row, analyses.get(row["line"]))
+        if not account["target_pain_points"] or not account["target_industries"]:
+            report[row["line"]].update(status="failed", error="ICP analysis failed and the row has no pain points/industries")
+            continue
+        accounts.append((row["line"], account))
+
+    insert_accounts(accounts, report)
+    return list(report.values())
+
+def write_report(report: List[dict], path: str) -> None:
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["line", "email", "status", "user_id", "error"], extrasaction="ignore")
+        writer.writeheader()
+        for entry in report:
+            writer.writerow(entry)
+
+def main():
+    parser = argparse.ArgumentParser(description="Onboard many users from a CSV or JSONL file")
+    parser.add_argument("file", help="Accounts file (.csv with a header row, or .jsonl)")
+    parser.add_argument("--report", help="Write the per-row results to this CSV file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    try:
+        report = bulk_onboard(read_rows(args.file))
+    finally:
+        close_writer()
+
+    counts = {}
+    for entry in report:
+        counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        if entry["status"] == "failed":
+            logger.error(f"Line {entry['line']} ({entry['email']}): {entry['error']}")
+    logger.info(f"Bulk onboarding finished: {counts}")
+    if args.report:
+        write_report(report, args.report)
+
+if __name__ == "__main__":
+    main()
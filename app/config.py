@@ -1,9 +1,12 @@
 from pydantic_settings import BaseSettings
 from typing import Optional
+import os
 
 class Settings(BaseSettings):
     # Database settings
     database_url: str = "sqlite:///./app.db"
+    db_write_batch_size: int = 50  # SQLite: writes grouped into one transaction by the writer thread
+    db_write_max_wait_ms: int = 50  # SQLite: how long the writer waits to fill a batch
     
     # Groq API settings
     groq_api_key: str = ""
@@ -17,9 +20,73 @@ class Settings(BaseSettings):
     # Lead search settings
     min_relevance_score: int = 30
     max_leads_per_run: int = 10
+    prompt_token_budget: int = 500  # Estimated tokens of page content sent to the LLM per site
+    relevance_hash_features: int = 16384  # Columns in the hashed term vectors
+    relevance_similarity_scale: float = 0.2  # Cosine similarity that counts as a perfect (100) match
+    queries_per_run: int = 5
+    query_max_empty_runs: int = 3  # Retire a query after this many runs in a row without an accepted lead
+    near_duplicate_max_distance: int = 3  # SimHash bits that may differ; must stay below the 4 LSH bands
+    
+    # HTML parsing settings (process pool, 0 workers parses inline)
+    parse_workers: int = os.cpu_count() or 1
+    parse_chunk_size: int = 4
+    parse_timeout_seconds: float = 60  # Longest wait for one batch of pages, cut to the time budget
+    html_parser: str = "auto"  # selectolax, lxml or html.parser; auto picks the fastest installed
+    
+    # Bulk onboarding settings
+    onboarding_workers: int = 8  # Concurrent ICP analyses
+    groq_requests_per_minute: int = 30  # Shared limit on onboarding ICP analyses
+    onboarding_batch_size: int = 100  # Accounts inserted per transaction
+    
+    # Lead export settings
+    export_batch_size: int = 1000  # Rows fetched per round trip while streaming
+    export_page_size: int = 100  # Default page size for keyset-paginated queries
     
     # Scheduler settings
     search_interval_minutes: int = 1 # 1440  # 24 hours
+    scheduler_tick_seconds: int = 15  # How often due users are dispatched
+    max_concurrent_users: int = 4
+    daily_lead_quota: int = 50  # Per user; users that hit it wait until the next UTC day
+    idle_backoff_factor: float = 4.0  # Interval multiplier for users whose recent runs found nothing
+    max_failure_backoff_factor: float = 16.0
+    schedule_jitter: float = 0.1  # +/- fraction of the interval added at random
+    
+    # Domain circuit breaker settings
+    domain_failure_threshold: int = 2  # Consecutive soft failures (timeouts, 5xx) before a domain is skipped
+    domain_cooldown_seconds: int = 3600  # First cool-down, doubled for each further failure
+    domain_max_cooldown_seconds: int = 30 * 24 * 3600
+    domain_status_cache_seconds: int = 300  # How long a healthy lookup is trusted in memory
+    
+    # Research refresh settings
+    research_refresh_interval_minutes: int = 60  # How often due sites are revalidated
+    research_refresh_days: int = 7  # Revalidate each researched site this often
+    research_refresh_batch: int = 20
+    
+    # Research retention settings
+    research_max_versions: int = 5  # Research versions kept per lead, newest first
+    research_retention_days: int = 180  # Superseded versions older than this are archived even under the cap
+    research_archive_dir: str = "./data/research_archive"  # Gzipped JSONL of pruned versions
+    retention_interval_hours: int = 24
+    retention_batch_size: int = 500
+    
+    # Record/replay of external calls (HTTP, search, LLM, SMTP)
+    replay_mode: str = ""  # "", "record" or "replay"
+    replay_archive: str = "./data/replay.jsonl.gz"
+    replay_latency_scale: float = 1.0  # Multiplier on recorded latencies when replaying; 0 serves instantly
+    
+    # Time budget settings (a run sheds remaining work once its budget is spent)
+    run_time_budget_seconds: int = 3600  # A run_prospecting_job pass over all users
+    user_time_budget_fraction: float = 0.8  # Share of a user's scheduled interval one run may take
+    min_call_timeout_seconds: float = 1.0  # Don't start an external call with less time left
+    http_timeout_seconds: float = 5
+    research_fetch_timeout_seconds: float = 15
+    llm_timeout_seconds: float = 60
+    smtp_timeout_seconds: float = 20
+    
+    # Sharding settings (several workers sharing one database)
+    worker_id: str = ""  # Defaults to hostname-pid
+    lease_ttl_seconds: int = 90
+    heartbeat_interval_seconds: int = 30
     
     class Config:
         env_file = ".env"
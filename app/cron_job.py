@@ -1,32 +1,38 @@
-import requests
-import json
-from groq import Groq
+from sqlalchemy.exc import IntegrityError
 from .database import get_db
-from .models import User, ICP, Lead, LeadResearch, Product
+from .models import User, ICP, Lead, LeadResearch, Product, ResearchSnapshot
 from .config import Settings
-from .utils.leads import search_leads
-from datetime import datetime
+from .utils.leads import search_leads, fetch_page, page_validators
+from .utils.llm import create_completion
+from .utils.email import deliver
+from .accounting import CostLedger, charging, stage, save_costs, new_run_id
+from .deadline import budget, expired
+from .utils.parsing import parse_pages
+from .utils.scoring import build_profile, score_candidates
+from .sharding import holds_lease
+from .dedupe import is_known_lead, make_fingerprint
+from .query_planner import plan_queries, record_query_results
+from .db_writer import write
+from .records import Candidate, Research
+from datetime import datetime, timedelta
 import logging
-from typing import List, Dict
-import time
-from bs4 import BeautifulSoup
-import smtplib
+from typing import List, Dict, NamedTuple
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from urllib.parse import urlparse
 import uuid
+import hashlib
+from functools import partial
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 settings = Settings()
-groq_client = Groq(api_key=settings.groq_api_key)
 
-def send_email_notification(user_email: str, lead_data: dict, user_data: dict) -> bool:
+def send_email_notification(user_email: str, lead: Candidate, user_data: dict) -> bool:
     try:
         # Determine greeting based on lead name availability
-        greeting = f"Dear {lead_data['lead_name']}" if lead_data['lead_name'] and lead_data['lead_name'] != 'None found' else f"Dear team at {lead_data['company_name']}"
+        greeting = f"Dear {lead.contact_name}" if lead.contact_name else f"Dear team at {lead.company_name}"
         
         # Generate personalized email content
         prompt = f"""Write a professional sales email.
@@ -38,10 +44,10 @@ Context:
 - Target Industries: {', '.join(user_data['target_industries'])}
 
 Lead Information:
-- Company: {lead_data['company_name']}
-- Website: {lead_data['company_website']}
-- Contact Name: {lead_data['lead_name'] if lead_data['lead_name'] != 'None found' else 'None'}
-- Company Description: {lead_data['company_description']}
+- Company: {lead.company_name}
+- Website: {lead.company_website}
+- Contact Name: {lead.contact_name or 'None'}
+- Company Description: {lead.company_description}
 
 Requirements:
 1. Start with: "{greeting}"
@@ -56,7 +62,8 @@ Requirements:
 
 Use a professional but conversational tone."""
 
-        completion = groq_client.chat.completions.create(
+        completion = create_completion(
+            call_site="email",
             model="llama-3.1-70b-versatile",
             messages=[
                 {"role": "system", "content": "You are a professional sales email writer. Write personalized, compelling emails that use available information effectively."},
@@ -78,10 +85,10 @@ Use a professional but conversational tone."""
         
         # Create the full email with lead details header
         full_email = f"""Lead Details:
-Company Name: {lead_data['company_name']}
-Company Website: {lead_data['company_website']}
-Lead Name: {lead_data['lead_name'] if lead_data['lead_name'] != 'None found' else 'TBD'}
-Lead Email: {lead_data['lead_email']}
+Company Name: {lead.company_name}
+Company Website: {lead.company_website}
+Lead Name: {lead.contact_name or 'TBD'}
+Lead Email: {lead.lead_email}
 
 Email Subject: {subject_line}
 
@@ -91,7 +98,7 @@ Email Body:
         
         # Create message
         msg = MIMEMultipart('alternative')
-        msg['Subject'] = f"New Lead Discovery: {lead_data['company_name']}"
+        msg['Subject'] = f"New Lead Discovery: {lead.company_name}"
         msg['From'] = f"Reka Sales Bot <{settings.gmail_email}>"
         msg['To'] = user_email
         
@@ -103,10 +110,7 @@ Email Body:
         msg.attach(html_part)
         
         # Send email via SMTP
-        with smtplib.SMTP(settings.smtp_server, settings.smtp_port) as server:
-            server.starttls()
-            server.login(settings.gmail_email, settings.gmail_password)
-            server.send_message(msg)
+        deliver(msg)
             
         return True
         
@@ -120,34 +124,57 @@ def format_list(items: list) -> str:
         return "None found"
     return "\n".join([f"- {item}" for item in items])
 
-def fetch_and_clean_website_content(url: str) -> str:
+def page_snapshot(summary: str, text: str, etag: str = None, last_modified: str = None, not_modified: bool = False) -> dict:
+    """What research and the refresh job need from a page: its prompt summary and the validators to revalidate it"""
+    return {
+        "not_modified": not_modified,
+        "content": summary,  # Densest page regions within the prompt token budget
+        "text": text,  # Full visible text, what relevance is scored on
+        "content_hash": hashlib.sha256(summary.encode()).hexdigest() if not not_modified else None,
+        "etag": etag,
+        "last_modified": last_modified
+    }
+
+def fetch_website_snapshot(url: str, etag: str = None, last_modified: str = None) -> dict:
+    """Fetch and clean a site, revalidating with a conditional GET when validators are given"""
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=15)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        response = fetch_page(url, timeout=settings.research_fetch_timeout_seconds, headers=headers)
+        new_etag, new_last_modified = page_validators(response)
+        etag, last_modified = new_etag or etag, new_last_modified or last_modified
         
-        # Remove script and style elements
-        for script in soup(["script", "style"]):
-            script.decompose()
-            
-        # Get text and clean it
-        text = soup.get_text(separator=' ', strip=True)
+        if response.status_code == 304:
+            return page_snapshot("", "", etag, last_modified, not_modified=True)
         
-        # Limit to first 2000 chars for token efficiency
-        return text[:2000]
+        page = parse_pages([(response.content, response.encoding)])[0]
+        if page is None:
+            return None
+        return page_snapshot(page.summary, page.text, etag, last_modified)
     except Exception as e:
         logger.error(f"Error fetching website content: {str(e)}")
-        return ""
+        return None
 
-def research_company(website: str, user_product: dict, user_icp: dict) -> dict:
+def research_company(website: str, user_product: dict, user_icp: dict, relevance_score: int = None,
+                     website_content: str = None, page_text: str = None) -> Research:
+    """Analyze a site for outreach; page_text is needed to score it when relevance_score isn't given"""
     try:
-        website_content = fetch_and_clean_website_content(website)
+        if website_content is None:
+            snapshot = fetch_website_snapshot(website) or {}
+            website_content = snapshot.get("content", "")
+            page_text = snapshot.get("text", "")
         if not website_content:
-            return {"error": "Could not fetch website content"}
+            return Research.failed("Could not fetch website content")
+        
+        # Score locally when the caller didn't already, and don't spend an LLM call on irrelevant sites.
+        # Scored on the full page text like search_leads does, so both gates agree on the same page
+        if relevance_score is None:
+            relevance_score = score_candidates([page_text or ""], build_profile(user_icp, user_product))[0]
+        if relevance_score < settings.min_relevance_score:
+            return Research.failed(f"Relevance score {relevance_score} below {settings.min_relevance_score}")
         
         prompt = f"""You are a helpful sales assistant. Analyze this company's website content and provide insights about how our product might help them.
 
@@ -164,7 +191,8 @@ Please provide a friendly analysis that could help write a personalized email. I
 
 Keep it conversational and friendly. No scoring or strict evaluation needed."""
 
-        completion = groq_client.chat.completions.create(
+        completion = create_completion(
+            call_site="research",
             model="llama-3.1-70b-versatile",
             messages=[{"role": "user", "content": prompt}],
             temperature=1,
@@ -177,12 +205,7 @@ Keep it conversational and friendly. No scoring or strict evaluation needed."""
         response_text = completion.choices[0].message.content
         
         # Process into sections for email
-        analysis = {
-            "company_description": [],
-            "potential_benefits": [],
-            "interesting_points": [],
-            "relevance_score": 70  # Default to moderately relevant
-        }
+        analysis = Research(relevance_score=relevance_score)
         
         current_section = None
         for line in response_text.split('\n'):
@@ -197,151 +220,275 @@ Keep it conversational and friendly. No scoring or strict evaluation needed."""
             elif "interesting" in line.lower():
                 current_section = "interesting_points"
             elif current_section and line.startswith(('-', '•', '*', '1.', '2.', '3.')):
-                analysis[current_section].append(line.lstrip('-•*123. '))
+                getattr(analysis, current_section).append(line.lstrip('-•*123. '))
         
         return analysis
         
     except Exception as e:
         logger.error(f"Error in research_company: {str(e)}")
-        return {"error": str(e)}
+        return Research.failed(str(e))
+
+def make_snapshot(lead_id, url: str, snapshot: dict) -> ResearchSnapshot:
+    now = datetime.utcnow()
+    return ResearchSnapshot(
+        lead_id=lead_id,
+        url=url,
+        content_hash=snapshot["content_hash"],
+        etag=snapshot["etag"],
+        last_modified=snapshot["last_modified"],
+        last_checked_at=now,
+        last_changed_at=now,
+        next_check_at=now + timedelta(days=settings.research_refresh_days)
+    )
+
+def save_new_lead(session, user_id, lead: Candidate, research: Research, snapshot: dict):
+    """Add a lead with its research, fingerprint and snapshot rows; returns the new lead_id"""
+    lead_id = uuid.uuid4()
+    now = datetime.utcnow()
+    session.add(Lead(
+        user_id=user_id,
+        lead_id=lead_id,
+        lead_name=lead.lead_name,
+        company_name=lead.company_name,
+        company_website=lead.company_website,
+        canonical_website=lead.canonical_website,
+        lead_email=lead.lead_email,
+        status="new",
+        created_at=now,
+        updated_at=now
+    ))
+    
+    # Create research entry
+    session.add(LeadResearch(
+        lead_id=lead_id,
+        insights=research.to_dict(),
+        source=lead.company_website,
+        created_at=now
+    ))
+    
+    if lead.content_simhash is not None:
+        session.add(make_fingerprint(lead_id, lead.content_simhash))
+    
+    session.add(make_snapshot(lead_id, lead.company_website, snapshot))
+    return lead_id
 
-def run_prospecting_job():
+def process_candidate(db, user, lead: Candidate, ledger: CostLedger, product_data: dict, icp_data: dict,
+                      user_data: dict, accepted_by_query: Dict[str, int]) -> None:
+    """Research, save and announce one candidate from search_leads, recording its outcome in ledger"""
+    try:
+        if expired():
+            logger.info(f"Time budget used up, skipping {lead.company_website}")
+            ledger.finish("failed", "deadline")
+            return
+        
+        logger.info(f"Processing lead: {lead.lead_name}")
+        
+        # Check for existing lead by canonical URL and content fingerprint
+        if is_known_lead(db, lead.company_website, lead.content_simhash):
+            logger.info(f"Lead {lead.lead_name} already exists, skipping")
+            ledger.finish("duplicate", "known_lead")
+            return
+            
+        # Research the company, keeping the validators and content hash for later refreshes
+        logger.info(f"Researching company: {lead.lead_name}")
+        if lead.summary is not None:
+            # search_leads already fetched and parsed the page; relevance_score saves needing its text
+            snapshot = page_snapshot(lead.summary, "", lead.etag, lead.last_modified)
+        else:
+            with stage("research_fetch"):
+                snapshot = fetch_website_snapshot(lead.company_website)
+        with stage("research"):
+            research = research_company(
+                lead.company_website,
+                product_data,
+                icp_data,
+                relevance_score=lead.relevance_score,
+                website_content=snapshot["content"] if snapshot else ""
+            )
+        
+        if research.error:
+            logger.error(f"Research failed for {lead.lead_name}: {research.error}")
+            if research.error.startswith("Relevance score"):
+                ledger.finish("filtered", "low_relevance")
+            elif expired():
+                ledger.finish("failed", "deadline")
+            else:
+                ledger.finish("failed", "research_failed")
+            return
+            
+        # Save new lead through the shared writer (a single writer thread on SQLite)
+        try:
+            with stage("save"):
+                lead_id = write(partial(save_new_lead, user_id=user.user_id, lead=lead, research=research, snapshot=snapshot))
+            logger.info(f"Successfully saved lead: {lead.company_name}")
+            ledger.finish("accepted", lead_id=lead_id)
+            accepted_by_query[lead.source_query] = accepted_by_query.get(lead.source_query, 0) + 1
+            
+            # Send email notification with user data
+            with stage("email"):
+                sent = send_email_notification(user.email, lead, user_data)
+            if sent:
+                logger.info(f"Email notification sent for lead: {lead.company_name}")
+            
+        except IntegrityError:
+            # Another user's run saved the same site between our duplicate check and this insert
+            logger.info(f"Lead {lead.company_name} was saved concurrently by another run, skipping")
+            ledger.finish("duplicate", "concurrent_insert")
+        except Exception as e:
+            logger.error(f"Error saving lead {lead.company_name}: {str(e)}")
+            ledger.finish("failed", "save_failed")
+            
+    except Exception as e:
+        logger.error(f"Error processing lead {lead.lead_name}: {str(e)}")
+        ledger.finish("failed", "error")
+
+class UserRun(NamedTuple):
+    """Result of one user's run"""
+    accepted: int  # Leads saved
+    failed: bool  # Nothing could be searched or fetched, as opposed to finding nothing
+
+# Candidates dropped before any fetch was attempted
+UNFETCHED_REASONS = ("same_url", "not_company", "domain_open", "deadline")
+
+def run_failed(query_stats: Dict[str, Dict[str, int]], costs: Dict[str, CostLedger]) -> bool:
+    """True when every search query errored, or every page fetch that was attempted failed"""
+    if expired():
+        return False  # Running out of time isn't the user's fault
+    if not query_stats or all(stats.get("error") for stats in query_stats.values()):
+        return True
+    fetched = [ledger for ledger in costs.values() if ledger.reason not in UNFETCHED_REASONS]
+    return bool(fetched) and all(ledger.reason == "fetch_error" for ledger in fetched)
+
+def process_user(db, user, max_leads: int = None) -> UserRun:
+    """Find, research and save new leads for one user, accepting at most max_leads (default max_leads_per_run)"""
+    max_leads = settings.max_leads_per_run if max_leads is None else max_leads
+    if max_leads <= 0:
+        logger.info(f"User {user.email} has no leads left in today's quota")
+        return UserRun(0, False)
+    icp = db.query(ICP).filter(ICP.user_id == user.user_id).first()
+    product = db.query(Product).filter(Product.user_id == user.user_id).first()
+    
+    if not icp or not product:
+        logger.warning(f"Missing ICP or product data for user {user.email}")
+        return UserRun(0, False)
+    
+    # Prepare user data for email
+    user_data = {
+        "name": user.name,
+        "company_name": user.company_name,
+        "product_name": product.name,
+        "product_description": product.description,
+        "target_industries": icp.target_industries
+    }
+    
+    # Convert ICP and Product to dict for search
+    icp_data = {
+        "target_industries": icp.target_industries,
+        "target_pain_points": getattr(icp, 'target_pain_points', []),  # Handle missing attribute
+        "geography": getattr(icp, 'geography', 'global')  # Default to global if not specified
+    }
+    
+    product_data = {
+        "name": product.name,
+        "description": product.description
+    }
+    
+    # Get keywords from ICP and product
+    keywords = (
+        icp.target_industries +
+        [user.industry] +
+        product.name.split() +
+        [kw.strip() for kw in product.description.split() if len(kw.strip()) > 4]
+    )
+    
+    # Remove duplicates and limit keywords
+    keywords = list(set(keywords))[:10]
+    logger.info(f"Searching with keywords: {keywords}")
+    
+    # Every candidate gets a cost ledger; work not tied to one (query planning, searches) is run overhead
+    run_id = new_run_id()
+    overhead = CostLedger()
+    costs = {}
+    query_stats = {}
+    accepted_by_query = {}
+    
+    try:
+        with charging(overhead):
+            # Reuse productive queries from the ledger, topping up from the LLM when needed
+            queries = plan_queries(db, user.user_id, keywords, icp_data, product_data)
+            
+            # Search for new leads
+            leads = search_leads(
+                keywords,
+                icp=icp_data,
+                product=product_data,
+                is_duplicate=lambda url, signature: is_known_lead(db, url, signature),
+                queries=queries,
+                stats=query_stats,
+                costs=costs,
+                max_results=max_leads
+            )
+        logger.info(f"Found {len(leads) if leads else 0} potential leads")
+        
+        for lead in leads:
+            ledger = costs.setdefault(lead.company_website, CostLedger(lead.company_website, lead.source_query))
+            if sum(accepted_by_query.values()) >= max_leads:
+                ledger.finish("filtered", "lead_limit")
+                continue
+            with charging(ledger):
+                process_candidate(db, user, lead, ledger, product_data, icp_data, user_data, accepted_by_query)
+    finally:
+        try:
+            write(partial(save_costs, run_id=run_id, user_id=user.user_id, ledgers=[overhead] + list(costs.values())))
+        except Exception as e:
+            logger.error(f"Error saving candidate costs: {str(e)}")
+    
+    record_query_results(user.user_id, query_stats, accepted_by_query)
+    failed = run_failed(query_stats, costs)
+    if failed:
+        logger.warning(f"Run for user {user.email} failed: every search or page fetch errored")
+    return UserRun(sum(accepted_by_query.values()), failed)
+
+def user_time_budget(interval_factor: float = 1.0) -> float:
+    """Seconds one user's run may take: a share of the interval until that user's next run"""
+    return settings.search_interval_minutes * 60 * interval_factor * settings.user_time_budget_fraction
+
+def run_prospecting_job(user_ids: List = None) -> Dict:
     db = next(get_db())
+    accepted = {}
     
     try:
-        # Get all users with ICP data
-        users = db.query(User).join(ICP).join(Product).all()
+        # Get all users with ICP data, restricted to this worker's shard when given
+        query = db.query(User).join(ICP).join(Product)
+        if user_ids is not None:
+            query = query.filter(User.user_id.in_(user_ids))
+        users = query.all()
         logger.info(f"Found {len(users)} users to process")
         
-        for user in users:
-            try:
-                icp = db.query(ICP).filter(ICP.user_id == user.user_id).first()
-                product = db.query(Product).filter(Product.user_id == user.user_id).first()
-                
-                if not icp or not product:
-                    logger.warning(f"Missing ICP or product data for user {user.email}")
-                    continue
-                
-                # Prepare user data for email
-                user_data = {
-                    "name": user.name,
-                    "company_name": user.company_name,
-                    "product_name": product.name,
-                    "product_description": product.description,
-                    "target_industries": icp.target_industries
-                }
-                
-                # Convert ICP and Product to dict for search
-                icp_data = {
-                    "target_industries": icp.target_industries,
-                    "target_pain_points": getattr(icp, 'target_pain_points', []),  # Handle missing attribute
-                    "geography": getattr(icp, 'geography', 'global')  # Default to global if not specified
-                }
-                
-                product_data = {
-                    "name": product.name,
-                    "description": product.description
-                }
-                
-                # Get keywords from ICP and product
-                keywords = (
-                    icp.target_industries +
-                    [user.industry] +
-                    product.name.split() +
-                    [kw.strip() for kw in product.description.split() if len(kw.strip()) > 4]
-                )
-                
-                # Remove duplicates and limit keywords
-                keywords = list(set(keywords))[:10]
-                logger.info(f"Searching with keywords: {keywords}")
-                
-                # Search for new leads
-                leads = search_leads(keywords, icp=icp_data, product=product_data)
-                logger.info(f"Found {len(leads) if leads else 0} potential leads")
-                
-                for lead_data in leads:
-                    try:
-                        logger.info(f"Processing lead: {lead_data.get('lead_name', 'Unknown Company')}")
-                        
-                        # Skip if missing required data
-                        if not all(key in lead_data for key in ['lead_name', 'company_website']):
-                            logger.warning(f"Invalid lead data structure: {lead_data}")
-                            continue
-                        
-                        # Use domain email if lead email is missing
-                        if 'lead_email' not in lead_data or not lead_data['lead_email']:
-                            domain = urlparse(lead_data['company_website']).netloc
-                            lead_data['lead_email'] = f'contact@{domain}'
-                        
-                        # Check for existing lead
-                        existing = db.query(Lead).filter(
-                            Lead.company_website == lead_data["company_website"]
-                        ).first()
-                        
-                        if existing:
-                            logger.info(f"Lead {lead_data['lead_name']} already exists, skipping")
-                            continue
-                            
-                        # Research the company
-                        logger.info(f"Researching company: {lead_data['lead_name']}")
-                        research = research_company(
-                            lead_data["company_website"],
-                            product_data,
-                            icp_data
-                        )
-                        
-                        if "error" in research:
-                            logger.error(f"Research failed for {lead_data['lead_name']}: {research['error']}")
-                            continue
-                            
-                        # Save new lead
-                        lead = Lead(
-                            user_id=user.user_id,
-                            lead_id=uuid.uuid4(),
-                            lead_name=lead_data["lead_name"],
-                            company_name=lead_data.get("company_name", lead_data["lead_name"]),  # Use lead_name as fallback
-                            company_website=lead_data["company_website"],
-                            lead_email=lead_data["lead_email"],
-                            status="new",
-                            created_at=datetime.utcnow(),
-                            updated_at=datetime.utcnow()
-                        )
-                        db.add(lead)
-                        
-                        # Create research entry
-                        lead_research = LeadResearch(
-                            lead_id=lead.lead_id,
-                            insights=research,
-                            source=lead_data["company_website"],
-                            created_at=datetime.utcnow()
-                        )
-                        db.add(lead_research)
-                        
-                        try:
-                            db.commit()
-                            logger.info(f"Successfully saved lead: {lead_data['company_name']}")
-                            
-                            # Send email notification with user data
-                            if send_email_notification(user.email, lead_data, user_data):
-                                logger.info(f"Email notification sent for lead: {lead_data['company_name']}")
-                            
-                        except Exception as e:
-                            db.rollback()
-                            logger.error(f"Error saving lead {lead_data['company_name']}: {str(e)}")
-                            continue
-                            
-                    except Exception as e:
-                        logger.error(f"Error processing lead {lead_data.get('lead_name', 'Unknown')}: {str(e)}")
+        with budget(settings.run_time_budget_seconds):
+            for user in users:
+                if expired():
+                    logger.info("Run time budget used up, leaving the remaining users for the next run")
+                    break
+                try:
+                    # Another worker may have taken this user over during a rebalance
+                    if user_ids is not None and not holds_lease(db, user.user_id):
+                        logger.info(f"User {user.email} is no longer leased to this worker, skipping")
                         continue
-                
-            except Exception as e:
-                logger.error(f"Error processing user {user.email}: {str(e)}")
-                continue
+                    
+                    with budget(user_time_budget()):
+                        accepted[user.user_id] = process_user(db, user).accepted
+                    
+                except Exception as e:
+                    logger.error(f"Error processing user {user.email}: {str(e)}")
+                    continue
                 
     except Exception as e:
         logger.error(f"Error in prospecting job: {str(e)}")
     finally:
         db.close()
+    
+    return accepted
 
 if __name__ == "__main__":
     run_prospecting_job()
\ No newline at end of file
@@ -1,25 +1,61 @@
-from sqlalchemy import create_engine
+import json
+from sqlalchemy import create_engine, event, inspect
 from sqlalchemy.orm import sessionmaker
 from .config import Settings
 from .models import Base
+from .research_search import create_search_index
+from .dedupe import backfill_canonical_websites
 
 settings = Settings()
 
+is_sqlite = settings.database_url.startswith("sqlite")
+
 # Add pool_recycle and timeout
 engine = create_engine(
     settings.database_url,
+    # Compact JSON, so the stored length is the size CompressedJSON tests against
+    json_serializer=lambda value: json.dumps(value, separators=(",", ":")),
     pool_recycle=3600,  # Recycle connections every hour
-    connect_args={"check_same_thread": False}  # For SQLite only
+    connect_args={"check_same_thread": False, "timeout": 30} if is_sqlite else {}  # For SQLite only
 )
 
+if is_sqlite:
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # Lets retention hand freed pages back with incremental_vacuum (new databases; existing ones are converted once)
+        cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        # WAL lets readers keep going while the single writer commits
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
 SessionLocal = sessionmaker(
     autocommit=False,
     autoflush=False,
     bind=engine
 )
 
+def add_missing_columns() -> None:
+    """create_all skips existing tables, so add nullable columns introduced after a table was created"""
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+        backfill_canonical_websites(connection)
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+    # create_all skips existing tables, so add indexes introduced after a table was created
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    create_search_index(engine)
     engine.dispose()  # Close all connections after init
 
 def get_db():
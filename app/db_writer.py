@@ -0,0 +1,168 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Tuple
+from .database import SessionLocal, engine
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+WriteFn = Callable[[Any], Any]  # Receives a Session, adds/updates rows, returns a plain per-item result (not ORM objects)
+
+_writer = None
+_writer_lock = threading.Lock()
+
+class Maintenance:
+    """Work that must run outside any transaction (VACUUM); it receives an AUTOCOMMIT connection, not a Session"""
+
+    def __init__(self, fn: Callable[[Any], Any]):
+        self.fn = fn
+
+def run_maintenance(work: Maintenance, future: Future) -> None:
+    try:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            future.set_result(work.fn(connection))
+    except Exception as e:
+        future.set_exception(e)
+
+class DBWriter:
+    """Single thread that owns all writes, grouping queued work into shared transactions
+
+    SQLite allows one writer at a time; funnelling writes from concurrent workers through
+    here avoids "database is locked" errors and turns many small commits into a few larger ones.
+    """
+
+    def __init__(self, batch_size: int, max_wait: float):
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, work: WriteFn) -> Future:
+        """Queue a write; the future resolves to work's return value once committed"""
+        future = Future()
+        self._queue.put((work, future))
+        return future
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+    def _next_batch(self) -> List[Tuple[WriteFn, Future]]:
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # Finish this batch, stop on the next loop
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            batch = [(work, future) for work, future in batch if future.set_running_or_notify_cancel()]
+            maintenance = [(work, future) for work, future in batch if isinstance(work, Maintenance)]
+            batch = [(work, future) for work, future in batch if not isinstance(work, Maintenance)]
+            if batch:
+                try:
+                    self._commit_together(batch)
+                except Exception as e:
+                    # One item spoiled the group (e.g. a unique violation); retry each on its own
+                    logger.info(f"Batch of {len(batch)} writes failed ({str(e)}), retrying individually")
+                    for item in batch:
+                        self._commit_one(item)
+            # Only after the batch has committed, so no other write is open on this database
+            for work, future in maintenance:
+                run_maintenance(work, future)
+
+    def _commit_together(self, batch: List[Tuple[WriteFn, Future]]) -> None:
+        session = SessionLocal()
+        try:
+            results = [work(session) for work, _ in batch]
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def _commit_one(self, item: Tuple[WriteFn, Future]) -> None:
+        work, future = item
+        session = SessionLocal()
+        try:
+            result = work(session)
+            session.commit()
+            future.set_result(result)
+        except Exception as e:
+            session.rollback()
+            future.set_exception(e)
+        finally:
+            session.close()
+
+class DirectWriter:
+    """Same interface for databases with concurrent writers (Postgres): commit in the caller's thread"""
+
+    def submit(self, work: WriteFn) -> Future:
+        future = Future()
+        future.set_running_or_notify_cancel()
+        if isinstance(work, Maintenance):
+            run_maintenance(work, future)
+            return future
+        session = SessionLocal()
+        try:
+            result = work(session)
+            session.commit()
+            future.set_result(result)
+        except Exception as e:
+            session.rollback()
+            future.set_exception(e)
+        finally:
+            session.close()
+        return future
+
+    def close(self) -> None:
+        pass
+
+def get_writer():
+    """Shared writer: a queue-fed writer thread on SQLite, direct commits elsewhere"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            if engine.dialect.name == "sqlite":
+                _writer = DBWriter(settings.db_write_batch_size, settings.db_write_max_wait_ms / 1000)
+            else:
+                _writer = DirectWriter()
+        return _writer
+
+def write(work: WriteFn) -> Any:
+    """Submit a write and wait for its result, re-raising its error"""
+    return get_writer().submit(work).result()
+
+def maintain(fn: Callable[[Any], Any]) -> Any:
+    """Run fn(connection) on the writer outside any transaction and wait for its result"""
+    return get_writer().submit(Maintenance(fn)).result()
+
+def close_writer() -> None:
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
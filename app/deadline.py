@@ -0,0 +1,44 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from .config import settings
+
+_deadline: ContextVar = ContextVar("deadline", default=None)  # time.monotonic() value, or None for no limit
+
+class DeadlineExceeded(Exception):
+    """The run's time budget is used up; remaining work should be skipped"""
+
+@contextmanager
+def budget(seconds: float):
+    """Limit the block to seconds from now, never extending an enclosing deadline"""
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining() -> Optional[float]:
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+def expired() -> bool:
+    """True once too little time is left to start another external call"""
+    left = remaining()
+    return left is not None and left < settings.min_call_timeout_seconds
+
+def call_timeout(default: float) -> float:
+    """Timeout for one external call: its usual limit, cut down to the time left"""
+    left = remaining()
+    if left is None:
+        return default
+    if left < settings.min_call_timeout_seconds:
+        raise DeadlineExceeded(f"{max(left, 0):.1f}s left in the time budget")
+    return min(default, left)
+
+def sleep_within(seconds: float) -> None:
+    """Sleep, but not past the deadline"""
+    left = remaining()
+    time.sleep(seconds if left is None else max(0.0, min(seconds, left)))
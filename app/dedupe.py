@@ -0,0 +1,62 @@
+import logging
+from typing import Optional
+from sqlalchemy import or_, select, update
+from .models import Lead, LeadFingerprint
+from .config import settings
+from .utils.fingerprint import canonicalize_url, band_values, hamming_distance, to_signed, to_unsigned
+
+logger = logging.getLogger(__name__)
+
+def find_near_duplicate(db, signature: int) -> Optional[LeadFingerprint]:
+    """Look up a stored fingerprint within the configured Hamming distance via the band indexes"""
+    bands = band_values(signature)
+    candidates = db.query(LeadFingerprint).filter(or_(
+        LeadFingerprint.band0 == bands[0],
+        LeadFingerprint.band1 == bands[1],
+        LeadFingerprint.band2 == bands[2],
+        LeadFingerprint.band3 == bands[3]
+    )).all()
+    for candidate in candidates:
+        if hamming_distance(to_unsigned(candidate.simhash), signature) <= settings.near_duplicate_max_distance:
+            return candidate
+    return None
+
+def is_known_lead(db, url: Optional[str], signature: Optional[int] = None) -> bool:
+    """True if the URL (canonicalized) or near-identical content is already stored as a lead; checks whichever is given"""
+    if url is not None and db.query(Lead.lead_id).filter(
+        or_(Lead.canonical_website == canonicalize_url(url), Lead.company_website == url)
+    ).first():
+        return True
+    if signature is not None:
+        match = find_near_duplicate(db, signature)
+        if match:
+            logger.info(f"{url or 'Page'} is a near-duplicate of lead {match.lead_id}")
+            return True
+    return False
+
+def backfill_canonical_websites(connection) -> int:
+    """Fill canonical_website for leads stored before it existed; later duplicates of a canonical URL stay NULL"""
+    taken = {value for (value,) in connection.execute(select(Lead.canonical_website).where(Lead.canonical_website.isnot(None)))}
+    rows = connection.execute(
+        select(Lead.lead_id, Lead.company_website).where(Lead.canonical_website.is_(None)).order_by(Lead.created_at)
+    ).all()
+    filled = 0
+    for lead_id, website in rows:
+        canonical = canonicalize_url(website)
+        if canonical in taken:
+            continue
+        taken.add(canonical)
+        connection.execute(update(Lead).where(Lead.lead_id == lead_id).values(canonical_website=canonical))
+        filled += 1
+    return filled
+
+def make_fingerprint(lead_id, signature: int) -> LeadFingerprint:
+    bands = band_values(signature)
+    return LeadFingerprint(
+        lead_id=lead_id,
+        simhash=to_signed(signature),
+        band0=bands[0],
+        band1=bands[1],
+        band2=bands[2],
+        band3=bands[3]
+    )
@@ -0,0 +1,154 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+from functools import partial
+from .database import SessionLocal
+from .db_writer import write
+from .models import DomainHealth
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Failures that say the site won't answer us at all; these open the breaker right away
+HARD_FAILURES = {'dns', 'connection', 'http_403', 'http_429', 'bot_wall'}
+
+# Markers only challenge pages carry; plain 'captcha' would match every site with a reCAPTCHA contact form
+BOT_WALL_MARKERS = (
+    'cf-chl', 'cf-browser-verification', 'challenge-platform', 'attention required! | cloudflare',
+    'checking your browser', '_incapsula_resource', 'px-captcha'
+)
+
+# In-memory negative cache: domain -> open_until, when the DB was last read for a domain,
+# and domains known to have no recorded failures (so successes need no write)
+_open_until: Dict[str, datetime] = {}
+_checked_at: Dict[str, float] = {}
+_clean = set()
+_cache_lock = threading.Lock()
+
+class DomainUnavailable(Exception):
+    """Raised instead of making a request to a domain whose breaker is open"""
+
+def domain_of(url: str) -> str:
+    host = (urlparse(url if '://' in url else 'https://' + url).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+def classify_exception(e: Exception) -> str:
+    """Map a requests exception to a failure reason"""
+    message = str(e).lower()
+    if 'name or service not known' in message or 'failed to resolve' in message or 'nodename nor servname' in message:
+        return 'dns'
+    name = type(e).__name__
+    if 'Timeout' in name:
+        return 'timeout'
+    if 'SSL' in name:
+        return 'ssl'
+    if 'Connection' in name:
+        return 'connection'
+    return 'error'
+
+def looks_like_bot_wall(response) -> bool:
+    """Small pages full of challenge markers are bot walls even when they return 200"""
+    if len(response.content) > 20000:
+        return False
+    text = response.text.lower()
+    return any(marker in text for marker in BOT_WALL_MARKERS)
+
+def is_open(domain: str) -> bool:
+    """True if requests to this domain should be skipped for now"""
+    now = datetime.utcnow()
+    with _cache_lock:
+        open_until = _open_until.get(domain)
+        if open_until and open_until > now:
+            return True
+        if time.monotonic() - _checked_at.get(domain, float('-inf')) < settings.domain_status_cache_seconds:
+            return False
+
+    db = SessionLocal()
+    try:
+        health = db.get(DomainHealth, domain)
+        open_until = health.open_until if health and health.state == "open" else None
+        clean = health is None or health.failure_count == 0
+    except Exception as e:
+        logger.error(f"Error reading domain health for {domain}: {str(e)}")
+        open_until = None
+        clean = False
+    finally:
+        db.close()
+
+    with _cache_lock:
+        _checked_at[domain] = time.monotonic()
+        if clean:
+            _clean.add(domain)
+        else:
+            _clean.discard(domain)
+        if open_until and open_until > now:
+            _open_until[domain] = open_until
+            return True
+        _open_until.pop(domain, None)
+    return False
+
+def _apply_to_row(session, domain: str, apply) -> Tuple[str, Optional[datetime], int]:
+    health = session.get(DomainHealth, domain)
+    if health is None:
+        health = DomainHealth(domain=domain, state="closed", failure_count=0)
+        session.add(health)
+    apply(health)
+    session.flush()  # So later writes in the same batch find this row
+    return health.state, health.open_until, health.failure_count
+
+def _update(domain: str, apply) -> Optional[Tuple[str, Optional[datetime], int]]:
+    """Apply a change to a domain's row; returns its new (state, open_until, failure_count)"""
+    try:
+        return write(partial(_apply_to_row, domain=domain, apply=apply))
+    except Exception as e:
+        logger.error(f"Error updating domain health for {domain}: {str(e)}")
+        return None
+
+def record_failure(domain: str, reason: str, retry_after: Optional[int] = None) -> None:
+    """Count a failure and open the breaker with an exponential cool-down once it trips"""
+    now = datetime.utcnow()
+    hard = reason in HARD_FAILURES
+
+    def apply(health):
+        health.failure_count += 1
+        health.last_failure_reason = reason
+        health.last_failure_at = now
+        threshold = 1 if hard else settings.domain_failure_threshold
+        if health.failure_count >= threshold:
+            cooldown = min(
+                settings.domain_cooldown_seconds * 2 ** (health.failure_count - threshold),
+                settings.domain_max_cooldown_seconds
+            )
+            if retry_after:
+                cooldown = max(cooldown, retry_after)
+            health.state = "open"
+            health.open_until = now + timedelta(seconds=cooldown)
+
+    with _cache_lock:
+        _clean.discard(domain)
+    result = _update(domain, apply)
+    if result is not None and result[0] == "open":
+        _, open_until, failure_count = result
+        with _cache_lock:
+            _open_until[domain] = open_until
+        logger.info(f"Skipping {domain} until {open_until:%Y-%m-%d %H:%M} after {failure_count} failures ({reason})")
+
+def record_success(domain: str) -> None:
+    """Close the breaker; only touches the database if the domain had failures"""
+    with _cache_lock:
+        if domain in _clean:
+            return
+
+    def apply(health):
+        health.state = "closed"
+        health.failure_count = 0
+        health.open_until = None
+        health.last_success_at = datetime.utcnow()
+
+    if _update(domain, apply) is not None:
+        with _cache_lock:
+            _open_until.pop(domain, None)
+            _clean.add(domain)
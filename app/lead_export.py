@@ -0,0 +1,163 @@
+import argparse
+import csv
+import json
+import logging
+import sys
+import uuid
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import select, and_, or_
+from .database import SessionLocal
+from .models import Lead, LeadResearch
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+LEAD_COLUMNS = (
+    Lead.lead_id,
+    Lead.user_id,
+    Lead.company_name,
+    Lead.company_website,
+    Lead.lead_name,
+    Lead.lead_email,
+    Lead.status,
+    Lead.created_at,
+    Lead.updated_at,
+)
+RESEARCH_FIELDS = ("relevance_score", "company_description", "potential_benefits", "interesting_points")
+EXPORT_FIELDS = [column.key for column in LEAD_COLUMNS] + list(RESEARCH_FIELDS) + ["researched_at"]
+
+def encode_cursor(created_at: datetime, lead_id) -> str:
+    """Opaque position after a lead, in (created_at, lead_id) order"""
+    return f"{created_at.isoformat()}|{uuid.UUID(str(lead_id)).hex}"
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    created_at, lead_id = cursor.split("|", 1)
+    return datetime.fromisoformat(created_at), uuid.UUID(lead_id)
+
+def lead_filters(user_id=None, statuses: Optional[List[str]] = None, since: Optional[datetime] = None,
+                 until: Optional[datetime] = None, cursor: Optional[str] = None) -> list:
+    conditions = []
+    if user_id is not None:
+        conditions.append(Lead.user_id == uuid.UUID(str(user_id)))
+    if statuses:
+        conditions.append(Lead.status.in_(statuses))
+    if since is not None:
+        conditions.append(Lead.created_at >= since)
+    if until is not None:
+        conditions.append(Lead.created_at < until)
+    if cursor:
+        # Keyset condition: strictly after the last row of the previous page
+        created_at, lead_id = decode_cursor(cursor)
+        conditions.append(or_(
+            Lead.created_at > created_at,
+            and_(Lead.created_at == created_at, Lead.lead_id > lead_id)
+        ))
+    return conditions
+
+def lead_query(**filters):
+    return select(*LEAD_COLUMNS).where(*lead_filters(**filters)).order_by(Lead.created_at, Lead.lead_id)
+
+def latest_research(db, lead_ids: list) -> Dict[uuid.UUID, Tuple[dict, datetime]]:
+    """Newest research insights per lead for one batch of leads"""
+    latest = {}
+    rows = db.execute(
+        select(LeadResearch.lead_id, LeadResearch.insights, LeadResearch.created_at)
+        .where(LeadResearch.lead_id.in_(lead_ids))
+        .order_by(LeadResearch.created_at)
+    )
+    for lead_id, insights, created_at in rows:
+        latest[lead_id] = (insights or {}, created_at)
+    return latest
+
+def to_record(row, research: Optional[Tuple[dict, datetime]]) -> dict:
+    record = dict(row._mapping)
+    insights, researched_at = research or ({}, None)
+    for field in RESEARCH_FIELDS:
+        record[field] = insights.get(field)
+    record["researched_at"] = researched_at
+    return record
+
+def query_leads(db, limit: Optional[int] = None, cursor: Optional[str] = None, **filters) -> Tuple[List[dict], Optional[str]]:
+    """One page of leads with their latest research; returns (records, cursor for the next page or None)"""
+    limit = limit or settings.export_page_size
+    rows = db.execute(lead_query(cursor=cursor, **filters).limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    research = latest_research(db, [row.lead_id for row in rows]) if rows else {}
+    records = [to_record(row, research.get(row.lead_id)) for row in rows]
+    next_cursor = encode_cursor(rows[-1].created_at, rows[-1].lead_id) if has_more else None
+    return records, next_cursor
+
+def stream_leads(db, cursor: Optional[str] = None, **filters) -> Iterator[dict]:
+    """Every matching lead in keyset order, fetched export_batch_size rows at a time"""
+    result = db.execute(lead_query(cursor=cursor, **filters).execution_options(yield_per=settings.export_batch_size))
+    for rows in result.partitions():
+        research = latest_research(db, [row.lead_id for row in rows])
+        for row in rows:
+            yield to_record(row, research.get(row.lead_id))
+
+def _plain(value, list_separator: Optional[str] = None):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, list) and list_separator is not None:
+        return list_separator.join(str(item) for item in value)
+    return value
+
+def write_csv(records: Iterator[dict], out) -> int:
+    writer = csv.DictWriter(out, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    count = 0
+    for record in records:
+        writer.writerow({key: _plain(value, "; ") for key, value in record.items()})
+        count += 1
+    return count
+
+def write_jsonl(records: Iterator[dict], out) -> int:
+    count = 0
+    for record in records:
+        out.write(json.dumps({key: _plain(value) for key, value in record.items()}) + "\n")
+        count += 1
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description="Export leads with their latest research")
+    parser.add_argument("--user", help="Only this user's leads (user_id)")
+    parser.add_argument("--status", action="append", help="Lead status to include; repeat for several")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Created at or after (ISO date/time, UTC)")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="Created before (ISO date/time, UTC)")
+    parser.add_argument("--after", help="Resume after this cursor (printed at the end of a previous export)")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+    parser.add_argument("--output", help="Output file (default: stdout)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    db = SessionLocal()
+    out = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+    last = {}
+
+    def track(records):
+        for record in records:
+            last["cursor"] = encode_cursor(record["created_at"], record["lead_id"])
+            yield record
+
+    try:
+        records = track(stream_leads(
+            db, cursor=args.after, user_id=args.user, statuses=args.status, since=args.since, until=args.until
+        ))
+        count = (write_csv if args.format == "csv" else write_jsonl)(records, out)
+        logger.info(f"Exported {count} leads")
+        if last:
+            logger.info(f"Resume cursor: {last['cursor']}")
+    except Exception as e:
+        logger.error(f"Error exporting leads: {str(e)}")
+        sys.exit(1)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        db.close()
+
+if __name__ == "__main__":
+    main()
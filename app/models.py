@@ -1,11 +1,34 @@
-from sqlalchemy import Column, String, JSON, UUID, ForeignKey, DateTime, Index
+from sqlalchemy import Column, String, JSON, UUID, ForeignKey, DateTime, Date, Float, Index, Integer, BigInteger, UniqueConstraint
 from sqlalchemy.orm import relationship, declarative_base
 from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.types import TypeDecorator
+import base64
+import json
 import uuid
+import zlib
 from datetime import datetime
 
 Base = declarative_base()
 
+class CompressedJSON(TypeDecorator):
+    """JSON column that stores large values as {"_z": base64 zlib}; plain JSON rows still read back as-is"""
+    impl = JSON
+    cache_ok = True
+    min_size = 512  # Smaller payloads don't shrink enough to pay for base64
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        raw = json.dumps(value, separators=(",", ":")).encode()
+        if len(raw) < self.min_size:
+            return value
+        return {"_z": base64.b64encode(zlib.compress(raw, 9)).decode()}
+
+    def process_result_value(self, value, dialect):
+        if isinstance(value, dict) and len(value) == 1 and "_z" in value:
+            return json.loads(zlib.decompress(base64.b64decode(value["_z"])))
+        return value
+
 class User(Base):
     __tablename__ = "users"
     user_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -52,7 +75,8 @@ class Lead(Base):
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.user_id", ondelete="CASCADE"), nullable=False)
     lead_name = Column(String, nullable=False)  # Contact person's name
     company_name = Column(String, nullable=False)  # Company name
-    company_website = Column(String, nullable=False, unique=True)  # Prevent duplicate leads
+    company_website = Column(String, nullable=False, unique=True)  # As fetched; research refreshes use it
+    canonical_website = Column(String)  # canonicalize_url(company_website), the dedupe key
     lead_email = Column(String, nullable=False)
     status = Column(String, nullable=False, default="new")  # new, qualified, contacted, converted, rejected
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
@@ -67,13 +91,15 @@ class Lead(Base):
         Index('idx_leads_user_id', 'user_id'),
         Index('idx_leads_status', 'status'),
         Index('idx_leads_created_at', 'created_at'),
+        Index('idx_leads_user_status_created', 'user_id', 'status', 'created_at'),  # Export and keyset pagination
+        Index('idx_leads_canonical_website', 'canonical_website', unique=True),  # Prevent duplicate leads
     )
 
 class LeadResearch(Base):
     __tablename__ = "lead_research"
     research_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     lead_id = Column(UUID(as_uuid=True), ForeignKey("leads.lead_id", ondelete="CASCADE"), nullable=False)
-    insights = Column(JSON, nullable=False)
+    insights = Column(CompressedJSON, nullable=False)
     source = Column(String, nullable=False)  # Website URL or other source
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
     
@@ -84,4 +110,144 @@ class LeadResearch(Base):
     __table_args__ = (
         Index('idx_research_lead_id', 'lead_id'),
         Index('idx_research_created_at', 'created_at'),
-    )
\ No newline at end of file
+    )
+
+class LeadFingerprint(Base):
+    __tablename__ = "lead_fingerprints"
+    lead_id = Column(UUID(as_uuid=True), ForeignKey("leads.lead_id", ondelete="CASCADE"), primary_key=True)
+    simhash = Column(BigInteger, nullable=False)  # 64-bit SimHash of the site's text, stored signed
+    # LSH bands of the signature; near-duplicates share at least one band
+    band0 = Column(Integer, nullable=False)
+    band1 = Column(Integer, nullable=False)
+    band2 = Column(Integer, nullable=False)
+    band3 = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    
+    # Indexes for band lookups
+    __table_args__ = (
+        Index('idx_fingerprints_band0', 'band0'),
+        Index('idx_fingerprints_band1', 'band1'),
+        Index('idx_fingerprints_band2', 'band2'),
+        Index('idx_fingerprints_band3', 'band3'),
+    )
+
+class ResearchSnapshot(Base):
+    __tablename__ = "research_snapshots"
+    lead_id = Column(UUID(as_uuid=True), ForeignKey("leads.lead_id", ondelete="CASCADE"), primary_key=True)
+    url = Column(String, nullable=False)
+    content_hash = Column(String)  # SHA-256 of the cleaned text the latest research was based on
+    etag = Column(String)  # HTTP validators for conditional GETs
+    last_modified = Column(String)
+    last_checked_at = Column(DateTime)
+    last_changed_at = Column(DateTime)
+    next_check_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    
+    # Relationships
+    lead = relationship("Lead")
+    
+    # Index for finding snapshots due for revalidation
+    __table_args__ = (
+        Index('idx_research_snapshots_next_check_at', 'next_check_at'),
+    )
+
+class DomainHealth(Base):
+    __tablename__ = "domain_health"
+    domain = Column(String, primary_key=True)
+    state = Column(String, nullable=False, default="closed")  # closed (requests allowed), open (skip until open_until)
+    failure_count = Column(Integer, nullable=False, default=0)  # Consecutive failures
+    last_failure_reason = Column(String)  # dns, connection, timeout, http_403, http_429, bot_wall, ...
+    last_failure_at = Column(DateTime)
+    last_success_at = Column(DateTime)
+    open_until = Column(DateTime)
+    
+    # Index for expiring open breakers
+    __table_args__ = (
+        Index('idx_domain_health_open_until', 'open_until'),
+    )
+
+class SearchQuery(Base):
+    __tablename__ = "search_queries"
+    query_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.user_id", ondelete="CASCADE"), nullable=False)
+    query_text = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="active")  # active, retired
+    runs = Column(Integer, nullable=False, default=0)
+    results = Column(Integer, nullable=False, default=0)  # URLs returned by the search engine
+    passed_filter = Column(Integer, nullable=False, default=0)  # Candidates that passed the site, duplicate and relevance filters
+    accepted_leads = Column(Integer, nullable=False, default=0)
+    empty_runs = Column(Integer, nullable=False, default=0)  # Consecutive runs without an accepted lead
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_used_at = Column(DateTime)
+    
+    # Index for loading a user's query pool
+    __table_args__ = (
+        UniqueConstraint('user_id', 'query_text', name='uq_search_queries_user_text'),
+        Index('idx_search_queries_user_status', 'user_id', 'status'),
+    )
+
+class UserSchedule(Base):
+    __tablename__ = "user_schedules"
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.user_id", ondelete="CASCADE"), primary_key=True)
+    next_run_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_run_at = Column(DateTime)
+    last_duration_seconds = Column(Float)
+    recent_yield = Column(Float, nullable=False, default=1.0)  # Moving average of leads accepted per run
+    consecutive_failures = Column(Integer, nullable=False, default=0)
+    quota_date = Column(Date)  # Day that leads_today counts towards
+    leads_today = Column(Integer, nullable=False, default=0)
+    
+    # Index for finding due users
+    __table_args__ = (
+        Index('idx_user_schedules_next_run_at', 'next_run_at'),
+    )
+
+class Worker(Base):
+    __tablename__ = "workers"
+    worker_id = Column(String, primary_key=True)  # hostname-pid unless configured
+    hostname = Column(String, nullable=False)
+    pid = Column(Integer, nullable=False)
+    started_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    heartbeat_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    # Index for finding live workers
+    __table_args__ = (
+        Index('idx_workers_heartbeat_at', 'heartbeat_at'),
+    )
+
+class UserLease(Base):
+    __tablename__ = "user_leases"
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.user_id", ondelete="CASCADE"), primary_key=True)
+    worker_id = Column(String, nullable=False)  # Worker currently processing this user
+    acquired_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+
+    # Indexes for faster lookups
+    __table_args__ = (
+        Index('idx_user_leases_worker_id', 'worker_id'),
+        Index('idx_user_leases_expires_at', 'expires_at'),
+    )
+
+class CandidateCost(Base):
+    __tablename__ = "candidate_costs"
+    cost_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    run_id = Column(String, nullable=False)  # One per user run
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.user_id", ondelete="CASCADE"), nullable=False)
+    url = Column(String)  # None for the run's shared overhead (query planning, searches)
+    source_query = Column(String)
+    outcome = Column(String, nullable=False)  # accepted, duplicate, filtered, failed, overhead
+    reason = Column(String)  # e.g. low_relevance, known_lead, fetch_error
+    lead_id = Column(UUID(as_uuid=True))  # Set when accepted
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    http_bytes = Column(Integer, nullable=False, default=0)
+    wall_seconds = Column(Float, nullable=False, default=0.0)
+    tokens = Column(JSON)  # call site -> [prompt tokens, completion tokens]
+    stage_seconds = Column(JSON)  # stage -> seconds
+    stage_bytes = Column(JSON)  # stage -> HTTP bytes downloaded
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    # Indexes for the per-user and per-run reports
+    __table_args__ = (
+        Index('idx_candidate_costs_user_created', 'user_id', 'created_at'),
+        Index('idx_candidate_costs_run_id', 'run_id'),
+    )
@@ -2,12 +2,11 @@ from app.database import SessionLocal
 from app.models import User, Product, ICP
 import uuid
 import re
-from groq import Groq
+from .utils.llm import create_completion
 from .config import settings
 import logging
 
 logger = logging.getLogger(__name__)
-groq_client = Groq()
 
 def analyze_product_for_icp(product_name: str, product_desc: str) -> dict:
     """Use Groq to analyze the product and suggest pain points and search strategies"""
@@ -27,7 +26,8 @@ Pain Point: [specific pain point]
 Search Term: [search term]
 Industry: [industry description]"""
 
-        completion = groq_client.chat.completions.create(
+        completion = create_completion(
+            call_site="icp_analysis",
             model="llama-3.1-70b-versatile",
             messages=[{"role": "user", "content": prompt}],
             temperature=1,
@@ -0,0 +1,109 @@
+import argparse
+import gzip
+import json
+import logging
+import os
+import statistics
+import time
+from typing import List, Optional, Tuple
+from .utils.html_backends import available_backends
+from .utils.parsing import ParsedPage, parse_html
+from .utils.fingerprint import hamming_distance
+
+logger = logging.getLogger(__name__)
+
+BASELINE = "html.parser"
+
+def load_pages(paths: List[str]) -> List[Tuple[str, bytes, Optional[str]]]:
+    """(name, raw bytes, encoding) from .html files, directories of them, and recorded replay archives"""
+    pages = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(('.html', '.htm')):
+                    with open(os.path.join(path, name), 'rb') as f:
+                        pages.append((name, f.read(), None))
+        elif path.endswith('.jsonl.gz'):
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    response = entry.get("response")
+                    if entry.get("kind") == "http" and response and response.get("status_code") == 200:
+                        pages.append((response["url"], response["content"].encode("latin-1"), response.get("encoding")))
+        else:
+            with open(path, 'rb') as f:
+                pages.append((os.path.basename(path), f.read(), None))
+    return pages
+
+def time_backend(backend: str, pages, repeat: int) -> Tuple[List[ParsedPage], List[float]]:
+    """Parse every page repeat times; returns the parsed pages and the best time per page"""
+    results = []
+    timings = []
+    for _, raw, encoding in pages:
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            parsed = parse_html(raw, encoding, backend)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        results.append(parsed)
+        timings.append(best)
+    return results, timings
+
+def jaccard(a: str, b: str) -> float:
+    left, right = set(a.lower().split()), set(b.lower().split())
+    if not left and not right:
+        return 1.0
+    return len(left & right) / len(left | right)
+
+def parity(results: List[ParsedPage], baseline: List[ParsedPage]) -> dict:
+    """How closely a backend's output matches the baseline's, averaged over pages"""
+    count = len(baseline)
+    distances = [hamming_distance(a.simhash, b.simhash) for a, b in zip(results, baseline)
+                 if a.simhash is not None and b.simhash is not None]
+    return {
+        "title": sum(a.title == b.title for a, b in zip(results, baseline)) / count,
+        "emails": sum(a.emails == b.emails for a, b in zip(results, baseline)) / count,
+        "text": statistics.mean(jaccard(a.text, b.text) for a, b in zip(results, baseline)),
+        "summary": statistics.mean(jaccard(a.summary, b.summary) for a, b in zip(results, baseline)),
+        "simhash_bits": statistics.mean(distances) if distances else 0.0
+    }
+
+def benchmark(pages, backends: List[str], repeat: int = 3) -> List[dict]:
+    baseline, _ = time_backend(BASELINE, pages, 1)
+    report = []
+    for backend in backends:
+        results, timings = time_backend(backend, pages, repeat)
+        ordered = sorted(timings)
+        report.append({
+            "backend": backend,
+            "pages_per_second": len(pages) / sum(timings) if sum(timings) else 0.0,
+            "mean_ms": statistics.mean(timings) * 1000,
+            "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+            **parity(results, baseline)
+        })
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare HTML parser backends for speed and output parity on saved pages")
+    parser.add_argument("paths", nargs="+", help="HTML files, directories of .html files, or replay archives (.jsonl.gz)")
+    parser.add_argument("--backend", action="append", choices=available_backends(), help="Backend to test (default: all installed)")
+    parser.add_argument("--repeat", type=int, default=3, help="Parses per page; the fastest counts")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    pages = load_pages(args.paths)
+    if not pages:
+        parser.error("no pages found")
+    logger.info(f"Benchmarking {len(pages)} pages ({sum(len(raw) for _, raw, _ in pages) / 1048576:.1f} MB)")
+
+    report = benchmark(pages, args.backend or available_backends(), args.repeat)
+    print(f"{'backend':<12} {'pages/s':>8} {'mean ms':>8} {'p95 ms':>7} {'title':>6} {'emails':>7} {'text':>6} {'summary':>8} {'simhash':>8}")
+    for entry in report:
+        print(f"{entry['backend']:<12} {entry['pages_per_second']:>8.1f} {entry['mean_ms']:>8.2f} {entry['p95_ms']:>7.2f} "
+              f"{entry['title']:>6.0%} {entry['emails']:>7.0%} {entry['text']:>6.3f} {entry['summary']:>8.3f} {entry['simhash_bits']:>8.2f}")
+    print(f"\nParity is against {BASELINE}: title/emails = share of pages identical, "
+          f"text/summary = mean word-set overlap, simhash = mean differing bits")
+
+if __name__ == "__main__":
+    main()
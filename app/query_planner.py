@@ -0,0 +1,87 @@
+import logging
+from datetime import datetime
+from typing import Dict, List
+from .models import SearchQuery
+from .config import settings
+from .utils.leads import generate_search_queries
+from .db_writer import write
+from functools import partial
+
+logger = logging.getLogger(__name__)
+
+def query_yield(query: SearchQuery) -> float:
+    """Smoothed accepted leads per run, so new queries get a fair first try"""
+    return (query.accepted_leads + 1) / (query.runs + 2)
+
+def plan_queries(db, user_id, keywords: List[str], icp: dict, product: dict) -> List[str]:
+    """Pick this run's search queries, asking the LLM for new ones only when productive queries run low"""
+    active = db.query(SearchQuery).filter(
+        SearchQuery.user_id == user_id,
+        SearchQuery.status == "active"
+    ).all()
+    active.sort(key=query_yield, reverse=True)
+    planned = [q.query_text for q in active[:settings.queries_per_run]]
+
+    if len(planned) < settings.queries_per_run:
+        # Skip anything already in the ledger, including retired queries
+        known = {text.lower() for (text,) in db.query(SearchQuery.query_text).filter(SearchQuery.user_id == user_id)}
+        new_queries = []
+        for text in generate_search_queries(keywords, icp, product):
+            if len(planned) + len(new_queries) >= settings.queries_per_run:
+                break
+            if text.lower() in known:
+                continue
+            known.add(text.lower())
+            new_queries.append(text)
+        planned += new_queries
+        if new_queries:
+            try:
+                write(partial(add_queries, user_id=user_id, texts=new_queries))
+            except Exception as e:
+                logger.error(f"Error saving new queries: {str(e)}")
+        logger.info(f"Planned {len(planned)} queries ({len(active)} from ledger)")
+    else:
+        logger.info(f"Planned {len(planned)} queries from ledger, no LLM call needed")
+
+    return planned
+
+def add_queries(session, user_id, texts: List[str]) -> None:
+    now = datetime.utcnow()
+    for text in texts:
+        session.add(SearchQuery(user_id=user_id, query_text=text, status="active", created_at=now))
+
+def apply_query_results(session, user_id, stats: Dict[str, Dict[str, int]], accepted: Dict[str, int]) -> None:
+    queries = session.query(SearchQuery).filter(
+        SearchQuery.user_id == user_id,
+        SearchQuery.query_text.in_(list(stats))
+    ).all()
+
+    now = datetime.utcnow()
+    for query in queries:
+        query_stats = stats[query.query_text]
+        if query_stats.get("error"):
+            continue  # The search itself failed (e.g. a 429), which says nothing about the query
+        accepted_now = accepted.get(query.query_text, 0)
+        results = query_stats.get("results", 0)
+        query.runs += 1
+        query.results += results
+        query.passed_filter += query_stats.get("passed_filter", 0)
+        query.accepted_leads += accepted_now
+        if accepted_now:
+            query.empty_runs = 0
+        elif not results or query_stats.get("claimed", 0) < results:
+            # Not empty when everything it found had already been found by another query this run
+            query.empty_runs += 1
+        query.last_used_at = now
+        if query.empty_runs >= settings.query_max_empty_runs:
+            query.status = "retired"
+            logger.info(f"Retiring exhausted query '{query.query_text}' ({query.accepted_leads} leads in {query.runs} runs)")
+
+def record_query_results(user_id, stats: Dict[str, Dict[str, int]], accepted: Dict[str, int]) -> None:
+    """Update the ledger with what each query produced this run and retire exhausted ones"""
+    if not stats:
+        return
+    try:
+        write(partial(apply_query_results, user_id=user_id, stats=stats, accepted=accepted))
+    except Exception as e:
+        logger.error(f"Error recording query results: {str(e)}")
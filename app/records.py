@@ -0,0 +1,79 @@
+import sys
+from typing import List, Optional
+from .domain_health import domain_of
+from .utils.fingerprint import canonicalize_url
+
+def _text(value) -> str:
+    return value.strip() if isinstance(value, str) else ''
+
+class Candidate:
+    """A prospective lead from search_leads, validated once here instead of at every hop.
+
+    Domains and search queries repeat across thousands of candidates, so they are interned.
+    Full page text stays in the parsed page; a candidate references the prompt summary and
+    keeps the response validators, so research can reuse the page instead of fetching it again.
+    """
+    __slots__ = ('company_website', 'canonical_website', 'domain', 'company_name', 'lead_name', 'lead_email',
+                 'company_description', 'relevance_score', 'content_simhash', 'source_query',
+                 'summary', 'etag', 'last_modified')
+
+    def __init__(self, url: str, company_name: str, lead_name: str, lead_email: str = None,
+                 company_description: str = None, relevance_score: int = None,
+                 content_simhash: Optional[int] = None, source_query: str = None,
+                 summary: str = None, etag: str = None, last_modified: str = None):
+        url = _text(url)
+        if not url or not domain_of(url):
+            raise ValueError(f"Candidate needs a website, got {url!r}")
+
+        # Fetched and stored as found, since some sites only answer on http or www; cost ledgers are keyed by it
+        self.company_website = url
+        self.canonical_website = canonicalize_url(url)  # Only for duplicate checks
+        self.domain = sys.intern(domain_of(self.canonical_website))
+        # The LLM sometimes returns no name at all; the lead has been paid for and is still worth keeping
+        self.lead_name = _text(lead_name) or 'None found'
+        self.company_name = _text(company_name) or self.contact_name or self.domain
+        self.lead_email = _text(lead_email) or f'contact@{self.domain}'
+        self.company_description = _text(company_description) or 'None found'
+        self.relevance_score = relevance_score
+        self.content_simhash = content_simhash
+        self.source_query = sys.intern(source_query) if source_query else None
+        self.summary = summary  # The parsed page's own string, not a copy
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @property
+    def contact_name(self) -> Optional[str]:
+        """The lead's name when extraction found a real person"""
+        return self.lead_name if self.lead_name != 'None found' else None
+
+    def __repr__(self) -> str:
+        return f"Candidate({self.company_name!r}, {self.company_website!r})"
+
+class Research:
+    """Sections of a company analysis from research_company, or the reason there is none"""
+    __slots__ = ('company_description', 'potential_benefits', 'interesting_points', 'relevance_score', 'error')
+
+    def __init__(self, company_description: List[str] = None, potential_benefits: List[str] = None,
+                 interesting_points: List[str] = None, relevance_score: int = None, error: str = None):
+        # The lists are kept, not copied; to_dict hands the same objects to the JSON column
+        self.company_description = company_description if company_description is not None else []
+        self.potential_benefits = potential_benefits if potential_benefits is not None else []
+        self.interesting_points = interesting_points if interesting_points is not None else []
+        self.relevance_score = relevance_score
+        self.error = error
+
+    @classmethod
+    def failed(cls, error: str) -> "Research":
+        return cls(error=error)
+
+    def to_dict(self) -> dict:
+        """The LeadResearch.insights shape"""
+        return {
+            "company_description": self.company_description,
+            "potential_benefits": self.potential_benefits,
+            "interesting_points": self.interesting_points,
+            "relevance_score": self.relevance_score
+        }
+
+    def __repr__(self) -> str:
+        return f"Research(error={self.error!r})" if self.error else f"Research(relevance_score={self.relevance_score})"
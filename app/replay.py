@@ -0,0 +1,177 @@
+import argparse
+import gzip
+import hashlib
+import importlib
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Optional
+import requests
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Exception types that can be re-raised from an archive; anything else replays as ReplayError
+REPLAYABLE_ERROR_MODULES = ("builtins", "socket", "smtplib", "requests.exceptions")
+
+_archive = None
+_archive_lock = threading.Lock()
+
+class ReplayError(Exception):
+    """A recorded call failed with an exception type that can't be rebuilt"""
+
+class ReplayMiss(Exception):
+    """Replay mode hit a call that was never recorded"""
+
+def call_key(kind: str, key: Any) -> str:
+    raw = json.dumps([kind, key], sort_keys=True, default=str)
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+class ReplayArchive:
+    """Gzipped JSONL of external calls: one line per call with its key, latency and response or error"""
+
+    def __init__(self, path: str, mode: str):
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._entries = defaultdict(deque)
+        self._file = None
+        if mode == "record":
+            self._file = gzip.open(path, "wt", encoding="utf-8")
+        else:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self._entries[entry["key"]].append(entry)
+            logger.info(f"Loaded {sum(len(q) for q in self._entries.values())} recorded calls from {path}")
+
+    def add(self, kind: str, key: Any, label: str, latency: float, response: Any = None, error: dict = None) -> None:
+        entry = {"kind": kind, "key": call_key(kind, key), "label": label, "latency": round(latency, 4)}
+        if error is not None:
+            entry["error"] = error
+        else:
+            entry["response"] = response
+        with self._lock:
+            self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def take(self, kind: str, key: Any) -> Optional[dict]:
+        """Recorded calls with the same key come back in order; the last one repeats"""
+        with self._lock:
+            entries = self._entries.get(call_key(kind, key))
+            if not entries:
+                return None
+            return entries.popleft() if len(entries) > 1 else entries[0]
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+def get_archive() -> ReplayArchive:
+    global _archive
+    with _archive_lock:
+        if _archive is None:
+            _archive = ReplayArchive(settings.replay_archive, settings.replay_mode)
+        return _archive
+
+def close_archive() -> None:
+    global _archive
+    with _archive_lock:
+        if _archive is not None:
+            _archive.close()
+            _archive = None
+
+def replaying() -> bool:
+    return settings.replay_mode == "replay"
+
+def dump_error(e: Exception) -> dict:
+    return {"module": type(e).__module__, "type": type(e).__name__, "message": str(e)}
+
+def load_error(error: dict) -> Exception:
+    if error["module"] in REPLAYABLE_ERROR_MODULES:
+        try:
+            cls = getattr(importlib.import_module(error["module"]), error["type"])
+            if isinstance(cls, type) and issubclass(cls, Exception):
+                return cls(error["message"])
+        except Exception:
+            pass
+    return ReplayError(f"{error['type']}: {error['message']}")
+
+def external_call(kind: str, key: Any, call: Callable[[], Any], dump: Callable[[Any], Any],
+                  load: Callable[[Any], Any], label: str = "") -> Any:
+    """Run an external call, recording it or serving it from the archive depending on replay_mode"""
+    mode = settings.replay_mode
+    if mode == "replay":
+        entry = get_archive().take(kind, key)
+        if entry is None:
+            raise ReplayMiss(f"No recorded {kind} call for {label or key}")
+        delay = entry["latency"] * settings.replay_latency_scale
+        if delay > 0:
+            time.sleep(delay)
+        if "error" in entry:
+            raise load_error(entry["error"])
+        return load(entry["response"])
+
+    started = time.monotonic()
+    try:
+        result = call()
+    except Exception as e:
+        if mode == "record":
+            get_archive().add(kind, key, label, time.monotonic() - started, error=dump_error(e))
+        raise
+    if mode == "record":
+        get_archive().add(kind, key, label, time.monotonic() - started, response=dump(result))
+    return result
+
+def dump_response(response) -> dict:
+    """requests.Response as JSON; the body is kept as latin-1 text, which round-trips any bytes"""
+    return {
+        "url": response.url,
+        "status_code": response.status_code,
+        "reason": response.reason,
+        "headers": dict(response.headers),
+        "encoding": response.encoding,
+        "content": response.content.decode("latin-1")
+    }
+
+def load_response(data: dict):
+    response = requests.models.Response()
+    response.url = data["url"]
+    response.status_code = data["status_code"]
+    response.reason = data["reason"]
+    response.headers = requests.structures.CaseInsensitiveDict(data["headers"])
+    response._content = data["content"].encode("latin-1")
+    response.encoding = data["encoding"]
+    return response
+
+def main():
+    parser = argparse.ArgumentParser(description="Record a prospecting run over all users, or replay one offline")
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("--archive", default=settings.replay_archive, help="Archive file (.jsonl.gz)")
+    parser.add_argument("--scale", type=float, default=settings.replay_latency_scale, help="Replay latency multiplier (0 = no waiting)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    settings.replay_mode = args.mode
+    settings.replay_archive = args.archive
+    settings.replay_latency_scale = args.scale
+
+    from .database import init_db
+    from .cron_job import run_prospecting_job
+    from .db_writer import close_writer
+    from .utils.parsing import shutdown_parse_pool
+
+    init_db()
+    started = time.monotonic()
+    try:
+        accepted = run_prospecting_job()
+    finally:
+        close_archive()
+        shutdown_parse_pool()
+        close_writer()
+    logger.info(f"{args.mode.capitalize()} run finished in {time.monotonic() - started:.1f}s, "
+                f"{sum(accepted.values())} leads accepted for {len(accepted)} users")
+
+if __name__ == "__main__":
+    main()
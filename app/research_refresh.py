@@ -0,0 +1,127 @@
+import logging
+from datetime import datetime, timedelta
+from .database import SessionLocal
+from .models import Lead, LeadResearch, ResearchSnapshot, ICP, Product
+from .config import settings
+from .cron_job import fetch_website_snapshot, research_company
+from .records import Research
+from .sharding import owned_user_ids
+from .db_writer import write
+from .deadline import budget, expired
+from functools import partial
+
+logger = logging.getLogger(__name__)
+
+def add_snapshots(session, leads) -> None:
+    now = datetime.utcnow()
+    for lead_id, url in leads:
+        session.add(ResearchSnapshot(lead_id=lead_id, url=url, next_check_at=now))
+
+def backfill_snapshots(db, user_ids) -> None:
+    """Give leads researched before snapshots existed a row so they get revalidated too"""
+    missing = db.query(Lead.lead_id, Lead.company_website).outerjoin(
+        ResearchSnapshot, ResearchSnapshot.lead_id == Lead.lead_id
+    ).filter(
+        ResearchSnapshot.lead_id.is_(None),
+        Lead.user_id.in_(user_ids)
+    ).limit(settings.research_refresh_batch).all()
+    if missing:
+        write(partial(add_snapshots, leads=[(row.lead_id, row.company_website) for row in missing]))
+
+def save_refresh(session, lead_id, url: str, changes: dict, research: Research = None) -> None:
+    """Apply snapshot changes and append a research version if one was produced"""
+    session.query(ResearchSnapshot).filter(ResearchSnapshot.lead_id == lead_id).update(changes, synchronize_session=False)
+    if research is not None:
+        session.add(LeadResearch(
+            lead_id=lead_id,
+            insights=research.to_dict(),
+            source=url,
+            created_at=changes["last_checked_at"]
+        ))
+
+def refresh_snapshot(snapshot: ResearchSnapshot, product_data: dict, icp_data: dict) -> bool:
+    """Revalidate one site and append a research version if its content changed; returns True if re-researched"""
+    now = datetime.utcnow()
+    changes = {
+        "last_checked_at": now,
+        "next_check_at": now + timedelta(days=settings.research_refresh_days)
+    }
+    research = None
+
+    site = fetch_website_snapshot(snapshot.url, snapshot.etag, snapshot.last_modified)
+    if site is not None:
+        changes["etag"] = site["etag"]
+        changes["last_modified"] = site["last_modified"]
+
+        if site["not_modified"] or site["content_hash"] == snapshot.content_hash:
+            pass
+        elif snapshot.content_hash is None:
+            # First look at a backfilled lead: record a baseline rather than paying for research
+            changes["content_hash"] = site["content_hash"]
+        else:
+            research = research_company(snapshot.url, product_data, icp_data,
+                                        website_content=site["content"], page_text=site["text"])
+            if research.error:
+                logger.error(f"Research refresh failed for {snapshot.url}: {research.error}")
+                research = None
+            else:
+                changes["content_hash"] = site["content_hash"]
+                changes["last_changed_at"] = now
+
+    write(partial(save_refresh, lead_id=snapshot.lead_id, url=snapshot.url, changes=changes, research=research))
+    if research is not None:
+        logger.info(f"Site changed, added new research version for {snapshot.url}")
+    return research is not None
+
+def refresh_due_research() -> int:
+    """Revalidate this worker's due sites with conditional GETs, re-researching only changed ones"""
+    db = SessionLocal()
+    refreshed = 0
+    try:
+        user_ids = owned_user_ids(db)
+        if not user_ids:
+            return 0
+        backfill_snapshots(db, user_ids)
+
+        due = db.query(ResearchSnapshot).join(Lead).filter(
+            Lead.user_id.in_(user_ids),
+            ResearchSnapshot.next_check_at <= datetime.utcnow()
+        ).order_by(ResearchSnapshot.next_check_at).limit(settings.research_refresh_batch).all()
+
+        profiles = {}
+        # Finish before the next refresh is due
+        with budget(settings.research_refresh_interval_minutes * 60):
+            for snapshot in due:
+                if expired():
+                    logger.info("Refresh time budget used up, leaving the remaining sites for the next run")
+                    break
+                try:
+                    user_id = snapshot.lead.user_id
+                    if user_id not in profiles:
+                        icp = db.query(ICP).filter(ICP.user_id == user_id).first()
+                        product = db.query(Product).filter(Product.user_id == user_id).first()
+                        profiles[user_id] = (
+                            {"name": product.name, "description": product.description} if product else None,
+                            {
+                                "target_industries": icp.target_industries,
+                                "target_pain_points": icp.target_pain_points,
+                                "geography": icp.geography
+                            } if icp else None
+                        )
+                    product_data, icp_data = profiles[user_id]
+                    if not product_data or not icp_data:
+                        continue
+
+                    if refresh_snapshot(snapshot, product_data, icp_data):
+                        refreshed += 1
+                except Exception as e:
+                    db.rollback()
+                    logger.error(f"Error refreshing research for {snapshot.url}: {str(e)}")
+
+        logger.info(f"Revalidated {len(due)} sites, {refreshed} changed and were re-researched")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error in research refresh: {str(e)}")
+    finally:
+        db.close()
+    return refreshed
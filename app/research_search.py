@@ -0,0 +1,178 @@
+import logging
+import re
+import uuid
+from typing import List
+from sqlalchemy import Table, Column, MetaData, Index, event, select, text, inspect
+from sqlalchemy.dialects.postgresql import UUID, TSVECTOR
+from .models import Lead, LeadResearch
+
+logger = logging.getLogger(__name__)
+
+# Searchable insight sections and their rank weights
+SEARCH_FIELDS = ("company_description", "potential_benefits", "interesting_points")
+FIELD_WEIGHTS = (1.0, 2.0, 1.0)  # Benefits mirror the pain points reps search for
+PG_WEIGHTS = ("B", "A", "B")
+
+# Postgres keeps the documents in a regular table with a GIN index; SQLite uses an FTS5 virtual table.
+# Kept off Base.metadata (TSVECTOR doesn't exist on SQLite), so lead_id is a plain key with no foreign key;
+# search_research already skips documents whose lead is gone.
+search_metadata = MetaData()
+research_search = Table(
+    "research_search",
+    search_metadata,
+    Column("lead_id", UUID(as_uuid=True), primary_key=True),
+    Column("research_id", UUID(as_uuid=True), nullable=False),
+    Column("user_id", UUID(as_uuid=True), nullable=False),
+    Column("document", TSVECTOR, nullable=False),
+    Index("idx_research_search_document", "document", postgresql_using="gin"),
+    Index("idx_research_search_user_id", "user_id"),
+)
+
+SQLITE_DDL = """CREATE VIRTUAL TABLE IF NOT EXISTS research_fts USING fts5(
+    lead_id UNINDEXED, research_id UNINDEXED, user_id UNINDEXED,
+    company_description, potential_benefits, interesting_points,
+    tokenize = 'porter unicode61'
+)"""
+
+# FTS5 can only look rows up by rowid, so each lead's document rowid is kept in an ordinary indexed table
+SQLITE_ROWS_DDL = "CREATE TABLE IF NOT EXISTS research_fts_leads (lead_id TEXT PRIMARY KEY, fts_rowid INTEGER NOT NULL)"
+
+def section_texts(insights: dict) -> List[str]:
+    texts = []
+    for field in SEARCH_FIELDS:
+        value = (insights or {}).get(field) or []
+        texts.append("\n".join(str(item) for item in value) if isinstance(value, list) else str(value))
+    return texts
+
+def index_research(connection, lead_id, research_id, user_id, insights: dict) -> None:
+    """Make this research the lead's searchable document, replacing any older version"""
+    texts = section_texts(insights)
+    if connection.dialect.name == "sqlite":
+        params = {"lead_id": lead_id.hex, "research_id": research_id.hex, "user_id": user_id.hex, "d": texts[0], "b": texts[1], "i": texts[2]}
+        rowid = connection.execute(text("SELECT fts_rowid FROM research_fts_leads WHERE lead_id = :lead_id"), params).scalar()
+        if rowid is not None:
+            connection.execute(
+                text("UPDATE research_fts SET research_id = :research_id, user_id = :user_id, "
+                     "company_description = :d, potential_benefits = :b, interesting_points = :i WHERE rowid = :rowid"),
+                {**params, "rowid": rowid}
+            )
+        else:
+            rowid = connection.execute(
+                text("INSERT INTO research_fts (lead_id, research_id, user_id, company_description, potential_benefits, interesting_points) "
+                     "VALUES (:lead_id, :research_id, :user_id, :d, :b, :i)"),
+                params
+            ).lastrowid
+            connection.execute(text("INSERT INTO research_fts_leads (lead_id, fts_rowid) VALUES (:lead_id, :rowid)"), {**params, "rowid": rowid})
+    elif connection.dialect.name == "postgresql":
+        document = " || ".join(f"setweight(to_tsvector('english', :t{n}), '{weight}')" for n, weight in enumerate(PG_WEIGHTS))
+        connection.execute(
+            text(f"INSERT INTO research_search (lead_id, research_id, user_id, document) "
+                 f"VALUES (:lead_id, :research_id, :user_id, {document}) "
+                 f"ON CONFLICT (lead_id) DO UPDATE SET research_id = EXCLUDED.research_id, document = EXCLUDED.document"),
+            {"lead_id": lead_id, "research_id": research_id, "user_id": user_id, "t0": texts[0], "t1": texts[1], "t2": texts[2]}
+        )
+
+@event.listens_for(LeadResearch, "after_insert")
+def _index_new_research(mapper, connection, target):
+    user_id = connection.execute(select(Lead.user_id).where(Lead.lead_id == target.lead_id)).scalar()
+    if user_id is not None:
+        index_research(connection, target.lead_id, target.research_id, user_id, target.insights)
+
+def create_search_index(engine) -> None:
+    """Create the full-text index if needed and fill it from existing research"""
+    dialect = engine.dialect.name
+    if dialect not in ("sqlite", "postgresql"):
+        logger.info(f"No full-text research index for {dialect}")
+        return
+    table_name = "research_fts_leads" if dialect == "sqlite" else "research_search"
+    if inspect(engine).has_table(table_name):
+        return
+
+    with engine.begin() as connection:
+        if dialect == "sqlite":
+            # An index built before the rowid table existed can't be updated in place, so rebuild it
+            connection.execute(text("DROP TABLE IF EXISTS research_fts"))
+            connection.execute(text(SQLITE_DDL))
+            connection.execute(text(SQLITE_ROWS_DDL))
+        else:
+            search_metadata.create_all(bind=connection)
+
+        # Backfill: rows arrive oldest first per lead, so the newest version wins
+        rows = connection.execution_options(yield_per=1000).execute(
+            select(LeadResearch.lead_id, LeadResearch.research_id, Lead.user_id, LeadResearch.insights)
+            .join(Lead, Lead.lead_id == LeadResearch.lead_id)
+            .order_by(LeadResearch.lead_id, LeadResearch.created_at)
+        )
+        latest = None
+        count = 0
+        for row in rows:
+            if latest is not None and latest.lead_id != row.lead_id:
+                index_research(connection, *latest)
+                count += 1
+            latest = row
+        if latest is not None:
+            index_research(connection, *latest)
+            count += 1
+    logger.info(f"Created full-text research index ({count} leads indexed)")
+
+def fts_query(query: str) -> str:
+    """Free text to an FTS5 query: every word must match, words are quoted so punctuation can't break the syntax"""
+    return " ".join(f'"{word}"' for word in re.findall(r"\w+", query))
+
+def search_research(db, query: str, user_id=None, limit: int = 20) -> List[dict]:
+    """Leads whose latest research best matches the query, best first"""
+    try:
+        dialect = db.get_bind().dialect.name
+        params = {"limit": limit}
+        if dialect == "sqlite":
+            params["query"] = fts_query(query)
+            if not params["query"]:
+                return []
+            user_filter = ""
+            if user_id is not None:
+                user_filter = "AND f.user_id = :user_id"
+                params["user_id"] = uuid.UUID(str(user_id)).hex
+            weights = ", ".join(["0", "0", "0"] + [str(w) for w in FIELD_WEIGHTS])
+            sql = f"""SELECT f.lead_id, -bm25(research_fts, {weights}) AS score,
+                       snippet(research_fts, -1, '[', ']', '...', 12) AS snippet
+                FROM research_fts f
+                WHERE research_fts MATCH :query {user_filter}
+                ORDER BY bm25(research_fts, {weights})
+                LIMIT :limit"""
+        elif dialect == "postgresql":
+            params["query"] = query
+            user_filter = ""
+            if user_id is not None:
+                user_filter = "AND s.user_id = :user_id"
+                params["user_id"] = uuid.UUID(str(user_id))
+            sql = f"""SELECT s.lead_id, ts_rank_cd(s.document, q) AS score, NULL AS snippet
+                FROM research_search s, websearch_to_tsquery('english', :query) q
+                WHERE s.document @@ q {user_filter}
+                ORDER BY score DESC
+                LIMIT :limit"""
+        else:
+            logger.error(f"Full-text research search is not supported on {dialect}")
+            return []
+
+        matches = db.execute(text(sql), params).all()
+        lead_ids = [uuid.UUID(str(row.lead_id)) for row in matches]
+        leads = {lead.lead_id: lead for lead in db.query(Lead).filter(Lead.lead_id.in_(lead_ids))} if lead_ids else {}
+
+        results = []
+        for lead_id, row in zip(lead_ids, matches):
+            lead = leads.get(lead_id)
+            if lead is None:
+                continue
+            results.append({
+                "lead_id": lead_id,
+                "user_id": lead.user_id,
+                "company_name": lead.company_name,
+                "company_website": lead.company_website,
+                "status": lead.status,
+                "score": round(float(row.score), 4),
+                "snippet": row.snippet or None
+            })
+        return results
+    except Exception as e:
+        logger.error(f"Error searching research for '{query}': {str(e)}")
+        return []
@@ -0,0 +1,137 @@
+import gzip
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import List
+from sqlalchemy import select, func, or_, cast, String, text
+from sqlalchemy.orm.attributes import flag_modified
+from .database import SessionLocal, engine
+from .models import Lead, LeadResearch, CompressedJSON
+from .config import settings
+from .sharding import owned_user_ids
+from .db_writer import write, maintain
+from functools import partial
+
+logger = logging.getLogger(__name__)
+
+def expired_research(db, user_ids) -> List[LeadResearch]:
+    """Superseded research versions beyond the per-lead cap or the retention window, oldest first"""
+    cutoff = datetime.utcnow() - timedelta(days=settings.research_retention_days)
+    ranked = select(
+        LeadResearch.research_id,
+        LeadResearch.created_at,
+        func.row_number().over(partition_by=LeadResearch.lead_id, order_by=LeadResearch.created_at.desc()).label("version")
+    ).join(Lead, Lead.lead_id == LeadResearch.lead_id).where(Lead.user_id.in_(user_ids)).subquery()
+
+    # The newest version of each lead is always kept
+    expired_ids = select(ranked.c.research_id).where(
+        ranked.c.version > 1,
+        or_(ranked.c.version > settings.research_max_versions, ranked.c.created_at < cutoff)
+    ).order_by(ranked.c.created_at).limit(settings.retention_batch_size)
+
+    return db.query(LeadResearch).filter(LeadResearch.research_id.in_(expired_ids)).order_by(LeadResearch.created_at).all()
+
+def archive_research(rows: List[LeadResearch]) -> str:
+    """Append rows to today's gzipped JSONL archive; returns the file path"""
+    os.makedirs(settings.research_archive_dir, exist_ok=True)
+    path = os.path.join(settings.research_archive_dir, f"lead_research-{datetime.utcnow():%Y-%m-%d}.jsonl.gz")
+    with gzip.open(path, "at", encoding="utf-8") as f:  # Each append is its own gzip member
+        for row in rows:
+            f.write(json.dumps({
+                "research_id": str(row.research_id),
+                "lead_id": str(row.lead_id),
+                "source": row.source,
+                "created_at": row.created_at.isoformat(),
+                "insights": row.insights
+            }) + "\n")
+    return path
+
+def delete_research(session, research_ids: list) -> int:
+    return session.query(LeadResearch).filter(LeadResearch.research_id.in_(research_ids)).delete(synchronize_session=False)
+
+def prune_research(db, user_ids) -> int:
+    """Archive then delete expired versions in batches; returns rows removed"""
+    removed = 0
+    while True:
+        rows = expired_research(db, user_ids)
+        if not rows:
+            return removed
+        path = archive_research(rows)
+        removed += write(partial(delete_research, research_ids=[row.research_id for row in rows]))
+        db.expire_all()
+        logger.info(f"Archived {len(rows)} research versions to {path}")
+        if len(rows) < settings.retention_batch_size:
+            return removed
+
+def recompress_research(session, research_ids: list) -> int:
+    """Rewrite rows so values stored before compression existed go through CompressedJSON"""
+    rows = session.query(LeadResearch).filter(LeadResearch.research_id.in_(research_ids)).all()
+    for row in rows:
+        flag_modified(row, "insights")
+    return len(rows)
+
+def compact_research(db, user_ids) -> int:
+    """Compress large insight payloads written before compression was enabled
+
+    The engine stores JSON compactly, so the stored length is the size CompressedJSON tests.
+    Older rows stored with spaces may fall under the threshold once rewritten; they are
+    rewritten once, compactly, and then no longer match.
+    """
+    stored = cast(LeadResearch.insights, String)
+    compacted = 0
+    last_id = None
+    while True:
+        query = db.query(LeadResearch.research_id).join(Lead).filter(
+            Lead.user_id.in_(user_ids),
+            func.length(stored) >= CompressedJSON.min_size,
+            stored.notlike('{"_z"%')
+        )
+        if last_id is not None:
+            query = query.filter(LeadResearch.research_id > last_id)
+        ids = [research_id for (research_id,) in query.order_by(LeadResearch.research_id).limit(settings.retention_batch_size)]
+        if not ids:
+            return compacted
+        compacted += write(partial(recompress_research, research_ids=ids))
+        last_id = ids[-1]
+
+def vacuum_and_analyze(connection) -> None:
+    """Return freed pages to the OS and refresh planner statistics; needs an AUTOCOMMIT connection"""
+    if engine.dialect.name == "sqlite":
+        if connection.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+            # Databases created before incremental mode need one full VACUUM to switch over
+            logger.info("Converting SQLite database to incremental auto-vacuum (one-time full VACUUM)")
+            connection.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+            connection.exec_driver_sql("VACUUM")
+        # executescript steps the pragma to completion; a plain execute frees a single page
+        connection.connection.driver_connection.executescript("PRAGMA incremental_vacuum")
+        connection.exec_driver_sql("ANALYZE")
+    elif engine.dialect.name == "postgresql":
+        connection.execute(text("VACUUM ANALYZE lead_research"))
+        connection.execute(text("ANALYZE leads"))
+
+def maintain_database() -> None:
+    """VACUUM/ANALYZE through the shared writer, so it never runs alongside another write"""
+    maintain(vacuum_and_analyze)
+
+def run_retention() -> int:
+    """Prune and compact this worker's research rows, then run database maintenance"""
+    db = SessionLocal()
+    removed = 0
+    try:
+        user_ids = owned_user_ids(db)
+        if user_ids:
+            removed = prune_research(db, user_ids)
+            compacted = compact_research(db, user_ids)
+            logger.info(f"Retention removed {removed} research versions and compressed {compacted} rows")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error in research retention: {str(e)}")
+    finally:
+        db.close()
+
+    try:
+        maintain_database()
+    except Exception as e:
+        logger.error(f"Error in database maintenance: {str(e)}")
+    return removed
@@ -0,0 +1,166 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import List
+from .database import SessionLocal
+from .models import User, UserSchedule
+from .config import settings
+from .cron_job import process_user, user_time_budget
+from .sharding import owned_user_ids, holds_lease, sync_leases
+from .db_writer import write
+from .deadline import budget
+from functools import partial
+
+logger = logging.getLogger(__name__)
+
+YIELD_SMOOTHING = 0.5  # Weight of the latest run in the moving average
+
+_executor = ThreadPoolExecutor(max_workers=settings.max_concurrent_users, thread_name_prefix="user-run")
+_running = set()
+_running_lock = threading.Lock()
+
+def interval_factor(schedule: UserSchedule) -> float:
+    """Multiple of the base search interval this user currently runs at"""
+    if schedule is None:
+        return 1.0
+    if schedule.consecutive_failures:
+        return min(2 ** schedule.consecutive_failures, settings.max_failure_backoff_factor)
+    # Users that keep finding leads run at the base interval, dry users slow down
+    return 1 + (settings.idle_backoff_factor - 1) * max(0.0, 1 - schedule.recent_yield)
+
+def leads_left_today(schedule: UserSchedule, today) -> int:
+    """How many more leads the daily quota allows this user today"""
+    if schedule is None or schedule.quota_date != today:
+        return settings.daily_lead_quota
+    return max(0, settings.daily_lead_quota - schedule.leads_today)
+
+def compute_next_run(schedule: UserSchedule, now: datetime) -> datetime:
+    """Next run time from the user's yield, daily quota and failure history, with jitter"""
+    interval = settings.search_interval_minutes * 60
+
+    if schedule.leads_today >= settings.daily_lead_quota:
+        # Quota used up, wait for the next UTC day
+        next_day = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        return next_day + timedelta(seconds=random.uniform(0, interval * settings.schedule_jitter))
+
+    jitter = random.uniform(-settings.schedule_jitter, settings.schedule_jitter)
+    return now + timedelta(seconds=interval * interval_factor(schedule) * (1 + jitter))
+
+def apply_run(session, user_id, accepted: int, failed: bool, duration: float) -> datetime:
+    """Update a user's schedule row after a run; returns the next run time"""
+    now = datetime.utcnow()
+    schedule = session.get(UserSchedule, user_id)
+    if schedule is None:
+        schedule = UserSchedule(user_id=user_id, recent_yield=1.0, consecutive_failures=0, leads_today=0)
+        session.add(schedule)
+
+    if schedule.quota_date != now.date():
+        schedule.quota_date = now.date()
+        schedule.leads_today = 0
+
+    if failed:
+        schedule.consecutive_failures += 1
+    else:
+        schedule.consecutive_failures = 0
+        schedule.recent_yield = YIELD_SMOOTHING * accepted + (1 - YIELD_SMOOTHING) * schedule.recent_yield
+        schedule.leads_today += accepted
+
+    schedule.last_run_at = now
+    schedule.last_duration_seconds = duration
+    schedule.next_run_at = compute_next_run(schedule, now)
+    return schedule.next_run_at
+
+def record_run(user_id, accepted: int, failed: bool, duration: float) -> None:
+    """Reschedule a user after a run"""
+    next_run_at = write(partial(apply_run, user_id=user_id, accepted=accepted, failed=failed, duration=duration))
+    logger.info(f"User {user_id} next run at {next_run_at:%Y-%m-%d %H:%M:%S}")
+
+def run_user(user_id) -> None:
+    """Process one user in its own session and reschedule it"""
+    db = SessionLocal()
+    started = time.monotonic()
+    accepted = 0
+    failed = False
+    try:
+        user = db.get(User, user_id)
+        if user is None or not holds_lease(db, user_id):
+            return
+        schedule = db.get(UserSchedule, user_id)
+        max_leads = min(settings.max_leads_per_run, leads_left_today(schedule, datetime.utcnow().date()))
+        # Leads found before the budget runs out are saved as they go; the rest is shed
+        with budget(user_time_budget(interval_factor(schedule))):
+            accepted, failed = process_user(db, user, max_leads)
+    except Exception as e:
+        failed = True
+        db.rollback()
+        logger.error(f"Error processing user {user_id}: {str(e)}")
+    finally:
+        try:
+            record_run(user_id, accepted, failed, time.monotonic() - started)
+        except Exception as e:
+            logger.error(f"Error rescheduling user {user_id}: {str(e)}")
+        db.close()
+        with _running_lock:
+            _running.discard(user_id)
+
+def add_schedules(session, user_ids) -> None:
+    now = datetime.utcnow()
+    for user_id in user_ids:
+        session.add(UserSchedule(user_id=user_id, next_run_at=now))
+
+def dispatch_due_users() -> int:
+    """Start runs for this worker's most overdue users, up to the concurrency cap"""
+    with _running_lock:
+        slots = settings.max_concurrent_users - len(_running)
+    if slots <= 0:
+        return 0
+
+    db = SessionLocal()
+    try:
+        owned = owned_user_ids(db)
+        if not owned:
+            return 0
+
+        # Users without a schedule yet are due immediately
+        scheduled = {row.user_id for row in db.query(UserSchedule.user_id).filter(UserSchedule.user_id.in_(owned))}
+        unscheduled = [user_id for user_id in owned if user_id not in scheduled]
+        if unscheduled:
+            write(partial(add_schedules, user_ids=unscheduled))
+
+        due = db.query(UserSchedule.user_id).filter(
+            UserSchedule.user_id.in_(owned),
+            UserSchedule.next_run_at <= datetime.utcnow()
+        ).order_by(UserSchedule.next_run_at, UserSchedule.recent_yield.desc()).all()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error finding due users: {str(e)}")
+        return 0
+    finally:
+        db.close()
+
+    started = 0
+    for (user_id,) in due:
+        with _running_lock:
+            if started >= slots or user_id in _running:
+                continue
+            _running.add(user_id)
+        _executor.submit(run_user, user_id)
+        started += 1
+
+    if started:
+        logger.info(f"Dispatched {started} users ({len(due)} due)")
+    return started
+
+def sync_user_leases() -> List:
+    """sync_leases without giving away a user whose run is in flight here.
+
+    The lock keeps dispatch from starting a user between the busy check and its release.
+    """
+    with _running_lock:
+        return sync_leases(busy=_running)
+
+def shutdown_scheduler(wait: bool = False) -> None:
+    _executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,167 @@
+import logging
+import math
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import Collection, List
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from .database import SessionLocal
+from .models import User, Worker, UserLease
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+WORKER_ID = settings.worker_id or f"{socket.gethostname()}-{os.getpid()}"
+
+def heartbeat(db) -> None:
+    """Record that this worker is alive and extend the leases it holds"""
+    now = datetime.utcnow()
+    worker = db.get(Worker, WORKER_ID)
+    if worker:
+        worker.heartbeat_at = now
+    else:
+        db.add(Worker(
+            worker_id=WORKER_ID,
+            hostname=socket.gethostname(),
+            pid=os.getpid(),
+            started_at=now,
+            heartbeat_at=now
+        ))
+    db.query(UserLease).filter(
+        UserLease.worker_id == WORKER_ID,
+        UserLease.expires_at > now
+    ).update({UserLease.expires_at: now + timedelta(seconds=settings.lease_ttl_seconds)}, synchronize_session=False)
+    db.commit()
+
+def live_worker_count(db) -> int:
+    """Count workers whose heartbeat is younger than the lease TTL"""
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.lease_ttl_seconds)
+    return max(db.query(Worker).filter(Worker.heartbeat_at > cutoff).count(), 1)
+
+def owned_user_ids(db) -> List:
+    """User IDs currently leased to this worker"""
+    rows = db.query(UserLease.user_id).filter(
+        UserLease.worker_id == WORKER_ID,
+        UserLease.expires_at > datetime.utcnow()
+    ).order_by(UserLease.acquired_at).all()
+    return [row.user_id for row in rows]
+
+def holds_lease(db, user_id) -> bool:
+    """Check that this worker still owns a user before doing work for it"""
+    return db.query(UserLease).filter(
+        UserLease.user_id == user_id,
+        UserLease.worker_id == WORKER_ID,
+        UserLease.expires_at > datetime.utcnow()
+    ).first() is not None
+
+def claim_user(db, user_id) -> bool:
+    """Try to take the lease for a user that is unowned or whose lease expired"""
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=settings.lease_ttl_seconds)
+
+    # Conditional update so two workers can't both win an expired lease
+    updated = db.query(UserLease).filter(
+        UserLease.user_id == user_id,
+        or_(UserLease.expires_at <= now, UserLease.worker_id == WORKER_ID)
+    ).update({
+        UserLease.worker_id: WORKER_ID,
+        UserLease.acquired_at: now,
+        UserLease.expires_at: expires_at
+    }, synchronize_session=False)
+    if updated:
+        db.commit()
+        return True
+
+    if db.get(UserLease, user_id):
+        return False  # Held by a live worker
+
+    try:
+        db.add(UserLease(user_id=user_id, worker_id=WORKER_ID, acquired_at=now, expires_at=expires_at))
+        db.commit()
+        return True
+    except IntegrityError:
+        db.rollback()  # Another worker inserted it first
+        return False
+
+def rebalance(db, busy: Collection = ()) -> List:
+    """Claim or release leases so each live worker holds roughly an equal share of users.
+
+    Users in busy have a run in flight on this worker and are kept until a later rebalance,
+    so another worker can't start a second run for them.
+    """
+    total_users = db.query(User).count()
+    fair_share = math.ceil(total_users / live_worker_count(db))
+    owned = owned_user_ids(db)
+
+    if len(owned) > fair_share:
+        # Give back the most recently acquired idle users so others can pick them up
+        excess = len(owned) - fair_share
+        released = [user_id for user_id in owned if user_id not in busy][-excess:]
+        if released:
+            db.query(UserLease).filter(
+                UserLease.worker_id == WORKER_ID,
+                UserLease.user_id.in_(released)
+            ).delete(synchronize_session=False)
+            db.commit()
+        if len(released) < excess:
+            logger.info(f"Worker {WORKER_ID} keeps {excess - len(released)} users over its fair share until their runs finish")
+        if released:
+            logger.info(f"Worker {WORKER_ID} released {len(released)} users (fair share {fair_share})")
+        return [user_id for user_id in owned if user_id not in released]
+
+    if len(owned) < fair_share:
+        now = datetime.utcnow()
+        candidates = db.query(User.user_id).outerjoin(
+            UserLease, UserLease.user_id == User.user_id
+        ).filter(
+            or_(UserLease.user_id.is_(None), UserLease.expires_at <= now)
+        ).order_by(User.user_id).limit(fair_share - len(owned)).all()
+
+        for row in candidates:
+            if claim_user(db, row.user_id):
+                owned.append(row.user_id)
+        if candidates:
+            logger.info(f"Worker {WORKER_ID} now holds {len(owned)} users (fair share {fair_share})")
+
+    return owned
+
+def sync_leases(busy: Collection = ()) -> List:
+    """Heartbeat, rebalance and return the user IDs this worker should process"""
+    db = SessionLocal()
+    try:
+        heartbeat(db)
+        return rebalance(db, busy)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error syncing user leases: {str(e)}")
+        return []
+    finally:
+        db.close()
+
+def release_all() -> None:
+    """Drop this worker's leases and heartbeat so other workers take over immediately"""
+    db = SessionLocal()
+    try:
+        db.query(UserLease).filter(UserLease.worker_id == WORKER_ID).delete(synchronize_session=False)
+        db.query(Worker).filter(Worker.worker_id == WORKER_ID).delete(synchronize_session=False)
+        db.commit()
+        logger.info(f"Worker {WORKER_ID} released all leases")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error releasing leases: {str(e)}")
+    finally:
+        db.close()
+
+def prune_dead_workers() -> None:
+    """Remove heartbeat rows of workers that stopped long ago"""
+    db = SessionLocal()
+    try:
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.lease_ttl_seconds * 10)
+        db.query(Worker).filter(Worker.heartbeat_at < cutoff).delete(synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error pruning dead workers: {str(e)}")
+    finally:
+        db.close()
@@ -0,0 +1,157 @@
+from typing import List, Tuple
+import json
+import math
+import re
+
+WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+# Lower rank is packed first; these regions describe the company densely
+REGION_RANKS = {
+    'organization': 0,  # JSON-LD Organization data
+    'meta_description': 1,
+    'og_description': 2,
+    'title': 3,
+    'og_title': 3,
+    'h1': 4,
+    'hero': 5,
+    'about': 6,
+    'h2': 7,
+    'body': 8,
+}
+
+REGION_LABELS = {
+    'organization': 'Organization',
+    'meta_description': 'Description',
+    'og_description': 'Description',
+    'title': 'Title',
+    'og_title': 'Title',
+    'h1': 'Heading',
+    'hero': 'Intro',
+    'about': 'About',
+    'h2': 'Section',
+    'body': 'Page text',
+}
+
+HERO_PATTERN = re.compile(r'hero|banner-main|intro|jumbotron|masthead', re.I)
+ABOUT_PATTERN = re.compile(r'about|mission|who-we-are|company|overview', re.I)
+BOILERPLATE_PATTERN = re.compile(r'cookie|consent|gdpr|newsletter|subscribe|modal|popup', re.I)
+
+ORGANIZATION_FIELDS = ('name', 'legalName', 'description', 'slogan', 'email', 'telephone', 'foundingDate', 'numberOfEmployees', 'address', 'areaServed')
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count: words and punctuation, or characters / 4, whichever is larger"""
+    return max(len(WORD_PATTERN.findall(text)), math.ceil(len(text) / 4))
+
+def clean(text: str) -> str:
+    return ' '.join(text.split())
+
+def _organization_text(data) -> List[str]:
+    """Flatten JSON-LD Organization objects (possibly nested in @graph or lists)"""
+    found = []
+    items = data if isinstance(data, list) else [data]
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        if '@graph' in item:
+            found += _organization_text(item['@graph'])
+        types = item.get('@type', [])
+        types = types if isinstance(types, list) else [types]
+        if any('Organization' in str(t) or t in ('Corporation', 'LocalBusiness') for t in types):
+            parts = []
+            for field in ORGANIZATION_FIELDS:
+                value = item.get(field)
+                if isinstance(value, dict):
+                    value = ', '.join(str(v) for k, v in value.items() if not k.startswith('@'))
+                elif isinstance(value, list):
+                    value = ', '.join(str(v) for v in value)
+                if value:
+                    parts.append(f"{field}: {clean(str(value))}")
+            if parts:
+                found.append('; '.join(parts))
+    return found
+
+BOILERPLATE_TAGS = ('script', 'style', 'noscript', 'nav', 'footer', 'form', 'svg')
+# Page structure: never removed, nor is anything wrapping it (e.g. <body class="modal-open">, ASP.NET's page-wide <form>)
+PROTECTED_TAGS = ('html', 'body', 'main', 'article', 'h1')
+REGION_TAGS = ('section', 'div', 'header', 'article', 'main', 'p')
+
+def extract_regions(doc) -> List[Tuple[str, str]]:
+    """Collect (kind, text) page regions from a parsed Document; strips boilerplate from it as it goes"""
+    regions = []
+
+    for raw in doc.json_ld():
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            continue
+        regions += [('organization', text) for text in _organization_text(data)]
+
+    for name, kind in (('description', 'meta_description'), ('og:description', 'og_description'), ('og:title', 'og_title')):
+        content = doc.meta_content(name)
+        if content:
+            regions.append((kind, clean(content)))
+
+    regions.append(('title', clean(doc.title())))
+
+    # Drop boilerplate before reading visible regions
+    doc.remove(BOILERPLATE_TAGS, BOILERPLATE_PATTERN, PROTECTED_TAGS)
+
+    regions += [('h1', clean(text)) for text in doc.tag_texts('h1')]
+
+    for kind, pattern in (('hero', HERO_PATTERN), ('about', ABOUT_PATTERN)):
+        regions += [(kind, clean(text)) for text in doc.pattern_texts(pattern, REGION_TAGS)]
+
+    regions += [('h2', clean(text)) for text in doc.tag_texts('h2')]
+
+    regions.append(('body', clean(doc.main_text())))
+
+    return [(kind, text) for kind, text in regions if text]
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    if estimate_tokens(text) <= budget:
+        return text
+    words = text.split()
+    low, high = 0, len(words)
+    while low < high:  # Longest word prefix that fits
+        mid = (low + high + 1) // 2
+        if estimate_tokens(' '.join(words[:mid])) <= budget:
+            low = mid
+        else:
+            high = mid - 1
+    return ' '.join(words[:low])
+
+# Shorter repeats (a company name, "Home") are left in place rather than cut out of every later region
+MIN_REPEAT_WORDS = 3
+
+def strip_included(text: str, included: List[str]) -> str:
+    """Cut text already packed out of a later region, e.g. the intro and about paragraphs out of the page text"""
+    for earlier in included:
+        if earlier in text and len(earlier.split()) >= MIN_REPEAT_WORDS:
+            text = text.replace(earlier, ' ')
+    return clean(text)
+
+def select_content(regions: List[Tuple[str, str]], budget: int) -> str:
+    """Pack the highest-ranked regions into the token budget, skipping text already included"""
+    ranked = sorted(regions, key=lambda region: REGION_RANKS.get(region[0], len(REGION_RANKS)))
+    lines = []
+    used = 0
+    seen = []
+    for kind, text in ranked:
+        if any(text in earlier for earlier in seen):
+            continue
+        text = strip_included(text, seen)
+        if not text:
+            continue
+        line = f"{REGION_LABELS.get(kind, kind)}: {text}"
+        cost = estimate_tokens(line)
+        if used + cost > budget:
+            line = truncate_to_tokens(line, budget - used)
+            if estimate_tokens(line) < 8:  # Not worth a fragment
+                continue
+            cost = estimate_tokens(line)
+        lines.append(line)
+        seen.append(text)
+        used += cost
+        if used >= budget:
+            break
+    return '\n'.join(lines)
@@ -3,12 +3,26 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from ..config import settings
 import logging
-from groq import Groq
+from .llm import create_completion
+from ..replay import external_call
+from ..deadline import call_timeout
+from ..records import Candidate, Research
 
 logger = logging.getLogger(__name__)
-groq_client = Groq()
 
-def generate_outreach_email(user_data: dict, lead_data: dict, research: dict) -> str:
+def deliver(msg) -> None:
+    """Send a message through the configured SMTP server within the time budget; replay mode skips the send"""
+    timeout = call_timeout(settings.smtp_timeout_seconds)
+
+    def send():
+        with smtplib.SMTP(settings.smtp_server, settings.smtp_port, timeout=timeout) as server:
+            server.starttls()
+            server.login(settings.gmail_email, settings.gmail_password)
+            server.send_message(msg)
+
+    external_call("smtp", {"to": msg['To'], "subject": msg['Subject']}, send, lambda _: None, lambda _: None, label=msg['To'])
+
+def generate_outreach_email(user_data: dict, lead: Candidate, research: Research) -> str:
     """Generate personalized outreach email using Groq"""
     try:
         prompt = f"""Generate a professional and personalized sales outreach email using this information:
@@ -19,11 +33,11 @@ def generate_outreach_email(user_data: dict, lead_data: dict, research: dict) ->
         - Product/Service: {user_data['product_description']}
 
         To:
-        - Company: {lead_data['company_name']}
-        - Website: {lead_data['company_website']}
+        - Company: {lead.company_name}
+        - Website: {lead.company_website}
 
         Research Insights:
-        {research.get('insights', {})}
+        {research.to_dict()}
 
         Write a concise, professional email that:
         1. Introduces yourself and your company
@@ -34,7 +48,8 @@ def generate_outreach_email(user_data: dict, lead_data: dict, research: dict) ->
 
         Keep it under 200 words and make it sound natural and personalized."""
 
-        completion = groq_client.chat.completions.create(
+        completion = create_completion(
+            call_site="outreach",
             model="llama-3.1-70b-versatile",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.7,
@@ -49,15 +64,15 @@ def generate_outreach_email(user_data: dict, lead_data: dict, research: dict) ->
         logger.error(f"Failed to generate outreach email: {str(e)}")
         return "Error generating outreach email template."
 
-def send_email_notification(to_email: str, user_data: dict, lead_data: dict, research: dict) -> bool:
+def send_email_notification(to_email: str, user_data: dict, lead: Candidate, research: Research) -> bool:
     """Send email notification about new lead"""
     try:
         # Generate outreach email
-        outreach_email = generate_outreach_email(user_data, lead_data, research)
+        outreach_email = generate_outreach_email(user_data, lead, research)
         
         # Create message
         msg = MIMEMultipart('alternative')
-        msg['Subject'] = f"New Lead Found: {lead_data['company_name']}"
+        msg['Subject'] = f"New Lead Found: {lead.company_name}"
         msg['From'] = f"Reka Sales Bot <{settings.gmail_email}>"
         msg['To'] = to_email
         
@@ -65,20 +80,20 @@ def send_email_notification(to_email: str, user_data: dict, lead_data: dict, res
 
 I found an interesting company that might be worth reaching out to:
 
-Company: {lead_data['company_name']}
-Website: {lead_data['company_website']}
-Contact: {lead_data['lead_email']}
+Company: {lead.company_name}
+Website: {lead.company_website}
+Contact: {lead.lead_email}
 
 Here's what I learned about them:
 
 What They Do:
-{research.get('company_description', 'Information not available')}
+{format_list(research.company_description)}
 
 How Your Product Could Help:
-{research.get('value_proposition', 'Information not available')}
+{format_list(research.potential_benefits)}
 
 Interesting Points for Outreach:
-{research.get('outreach_points', 'Information not available')}
+{format_list(research.interesting_points)}
 
 Suggested Outreach Email:
 -------------------
@@ -98,10 +113,7 @@ Your Sales Assistant"""
         msg.attach(html_part)
         
         # Send email via SMTP
-        with smtplib.SMTP(settings.smtp_server, settings.smtp_port) as server:
-            server.starttls()
-            server.login(settings.gmail_email, settings.gmail_password)
-            server.send_message(msg)
+        deliver(msg)
             
         return True
         
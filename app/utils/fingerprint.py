@@ -0,0 +1,85 @@
+from typing import Dict, List, Optional
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+import hashlib
+import re
+import numpy as np
+
+WORD_PATTERN = re.compile(r"\w+")
+SHINGLE_SIZE = 3
+MIN_SHINGLES = 8  # Pages with less text than this are too thin to fingerprint reliably
+BANDS = 4  # 64-bit signature split into 4 x 16-bit bands; any pair within 3 bits shares a band
+BAND_BITS = 64 // BANDS
+
+TRACKING_PARAMS = {'gclid', 'fbclid', 'msclkid', 'ref', 'source', 'mc_cid', 'mc_eid'}
+
+def canonicalize_url(url: str) -> str:
+    """Normalize a company URL so trivial variants (scheme, www, trailing slash, tracking params) compare equal"""
+    if not url.startswith(('http://', 'https://')):
+        url = 'https://' + url
+    parts = urlparse(url.strip())
+
+    host = (parts.hostname or '').lower().rstrip('.')
+    if host.startswith('www.'):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+
+    path = parts.path.rstrip('/')
+    if path.lower() in ('/index.html', '/index.htm', '/index.php', '/home'):
+        path = ''
+
+    query = urlencode(sorted(
+        (k, v) for k, v in parse_qsl(parts.query)
+        if not k.lower().startswith('utm_') and k.lower() not in TRACKING_PARAMS
+    ))
+    return urlunparse(('https', host, path, '', query, ''))
+
+def simhash(text: str) -> Optional[int]:
+    """64-bit SimHash over word shingles, or None when the text is too short"""
+    words = WORD_PATTERN.findall(text.lower())
+    shingles = {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    if len(shingles) < MIN_SHINGLES:
+        return None
+
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), 'big') for s in shingles],
+        dtype='>u8'
+    )
+    # One row of 64 bits per shingle; a bit is set in the signature if most shingles set it
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1)
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(shingles)
+    return int.from_bytes(np.packbits(votes > 0).tobytes(), 'big')
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+def band_values(signature: int) -> List[int]:
+    """Split a signature into the LSH band keys used for candidate lookup"""
+    mask = (1 << BAND_BITS) - 1
+    return [(signature >> (i * BAND_BITS)) & mask for i in range(BANDS)]
+
+def to_signed(signature: int) -> int:
+    """Store an unsigned 64-bit signature in a signed BIGINT column"""
+    return signature - (1 << 64) if signature >= 1 << 63 else signature
+
+def to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+class SimHashIndex:
+    """In-memory LSH index of signatures seen during a run"""
+
+    def __init__(self, max_distance: int):
+        self.max_distance = max_distance
+        self.buckets: List[Dict[int, List[int]]] = [{} for _ in range(BANDS)]
+
+    def add(self, signature: int) -> None:
+        for band, value in enumerate(band_values(signature)):
+            self.buckets[band].setdefault(value, []).append(signature)
+
+    def find(self, signature: int) -> Optional[int]:
+        """Return a stored signature within max_distance bits, if any"""
+        for band, value in enumerate(band_values(signature)):
+            for candidate in self.buckets[band].get(value, []):
+                if hamming_distance(candidate, signature) <= self.max_distance:
+                    return candidate
+        return None
@@ -0,0 +1,234 @@
+from abc import ABC, abstractmethod
+from typing import List, Optional, Pattern, Sequence
+import logging
+from bs4 import BeautifulSoup, CData, NavigableString
+from ..config import settings
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    try:
+        from selectolax.parser import HTMLParser as LexborHTMLParser  # Older selectolax: Modest engine
+    except ImportError:
+        LexborHTMLParser = None
+
+logger = logging.getLogger(__name__)
+
+PREFERENCE = ("selectolax", "lxml", "html.parser")  # Fastest first
+
+# Where the HTML5 parsers put a page's title when it has no <body>
+HEAD_TAGS = ('head', 'title')
+
+class Document(ABC):
+    """The few HTML operations the parser needs, implemented by each backend over its own tree"""
+
+    @abstractmethod
+    def title(self) -> str:
+        pass
+
+    @abstractmethod
+    def meta_content(self, name: str) -> Optional[str]:
+        """content of <meta name=...> or <meta property=...>"""
+
+    @abstractmethod
+    def json_ld(self) -> List[str]:
+        """Raw bodies of application/ld+json scripts"""
+
+    @abstractmethod
+    def remove(self, tags: Sequence[str], pattern: Pattern, protected: Sequence[str]) -> None:
+        """Drop elements with these tags or a class/id matching pattern, with their content,
+        unless they are or contain a protected tag"""
+
+    @abstractmethod
+    def tag_texts(self, tag: str) -> List[str]:
+        pass
+
+    @abstractmethod
+    def pattern_texts(self, pattern: Pattern, tags: Sequence[str]) -> List[str]:
+        """Text of elements with these tags whose class (first) or id (then) matches pattern"""
+
+    @abstractmethod
+    def main_text(self) -> str:
+        """Text of <main>, else <body>, else the whole document"""
+
+    @abstractmethod
+    def text(self) -> str:
+        pass
+
+class SoupDocument(Document):
+    """BeautifulSoup over the pure-Python html.parser; always available"""
+
+    def __init__(self, html: str):
+        self.soup = BeautifulSoup(html, 'html.parser')
+
+    def title(self) -> str:
+        return self.soup.title.get_text() if self.soup.title else ''
+
+    def meta_content(self, name: str) -> Optional[str]:
+        tag = self.soup.find('meta', attrs={'name': name}) or self.soup.find('meta', attrs={'property': name})
+        return tag.get('content') if tag else None
+
+    def json_ld(self) -> List[str]:
+        return [script.string or '' for script in self.soup.find_all('script', type='application/ld+json')]
+
+    def remove(self, tags: Sequence[str], pattern: Pattern, protected: Sequence[str]) -> None:
+        doomed = self.soup(list(tags)) + self.soup.find_all(attrs={'class': pattern}) + self.soup.find_all(attrs={'id': pattern})
+        for element in doomed:
+            if element.decomposed or element.name in protected or element.find(list(protected)):
+                continue
+            element.decompose()
+
+    def tag_texts(self, tag: str) -> List[str]:
+        return [element.get_text(separator=' ') for element in self.soup.find_all(tag)]
+
+    def pattern_texts(self, pattern: Pattern, tags: Sequence[str]) -> List[str]:
+        elements = self.soup.find_all(attrs={'class': pattern}) + self.soup.find_all(attrs={'id': pattern})
+        return [element.get_text(separator=' ') for element in elements if element.name in tags]
+
+    def main_text(self) -> str:
+        element = self.soup.find('main') or self.soup.body
+        if element is not None:
+            return element.get_text(separator=' ')
+        # html.parser doesn't add a <body> like lxml and Lexbor do, so leave out what they would put in <head>
+        strings = self.soup.find_all(string=True)
+        return ' '.join(s for s in strings if type(s) in (NavigableString, CData) and s.find_parent(HEAD_TAGS) is None)
+
+    def text(self) -> str:
+        return self.soup.get_text(separator=' ')
+
+class LxmlDocument(Document):
+    """lxml's libxml2 HTML parser"""
+
+    def __init__(self, html: str):
+        # Parse bytes so pages with an XML encoding declaration don't trip lxml's str check
+        parser = lxml.html.HTMLParser(encoding='utf-8')
+        data = html.encode('utf-8', errors='replace')
+        self.root = lxml.html.document_fromstring(data, parser=parser) if html.strip() else lxml.html.Element('html')
+
+    @staticmethod
+    def _text(element) -> str:
+        return ' '.join(element.itertext())
+
+    def title(self) -> str:
+        element = self.root.find('.//title')
+        return self._text(element) if element is not None else ''
+
+    def meta_content(self, name: str) -> Optional[str]:
+        for attribute in ('name', 'property'):
+            found = self.root.xpath(f'//meta[@{attribute}=$name]/@content', name=name)
+            if found:
+                return found[0]
+        return None
+
+    def json_ld(self) -> List[str]:
+        return [script.text or '' for script in self.root.xpath('//script[@type="application/ld+json"]')]
+
+    def _matches(self, pattern: Pattern, attribute: str) -> list:
+        return [element for element in self.root.xpath(f'//*[@{attribute}]') if pattern.search(element.get(attribute))]
+
+    def remove(self, tags: Sequence[str], pattern: Pattern, protected: Sequence[str]) -> None:
+        doomed = list(self.root.iter(*tags)) + self._matches(pattern, 'class') + self._matches(pattern, 'id')
+        for element in doomed:
+            if next(element.iter(*protected), None) is not None:  # iter() includes the element itself
+                continue
+            if element.getparent() is not None:
+                # drop_tree keeps the tail text, which belongs to the parent, but glues it to the text before
+                element.tail = ' ' + (element.tail or '')
+                element.drop_tree()
+
+    def tag_texts(self, tag: str) -> List[str]:
+        return [self._text(element) for element in self.root.iter(tag)]
+
+    def pattern_texts(self, pattern: Pattern, tags: Sequence[str]) -> List[str]:
+        elements = self._matches(pattern, 'class') + self._matches(pattern, 'id')
+        return [self._text(element) for element in elements if element.tag in tags]
+
+    def main_text(self) -> str:
+        element = self.root.find('.//main')
+        if element is None:
+            element = self.root.find('body')
+        return self._text(element if element is not None else self.root)
+
+    def text(self) -> str:
+        return self._text(self.root)
+
+class SelectolaxDocument(Document):
+    """selectolax over the Lexbor engine (C, no Python tree), the fastest option"""
+
+    def __init__(self, html: str):
+        self.tree = LexborHTMLParser(html)
+
+    def title(self) -> str:
+        node = self.tree.css_first('title')
+        return node.text(separator=' ') if node else ''
+
+    def meta_content(self, name: str) -> Optional[str]:
+        for attribute in ('name', 'property'):
+            node = self.tree.css_first(f'meta[{attribute}="{name}"]')
+            if node is not None:
+                return node.attributes.get('content')
+        return None
+
+    def json_ld(self) -> List[str]:
+        return [node.text() for node in self.tree.css('script[type="application/ld+json"]')]
+
+    def _matches(self, pattern: Pattern, attribute: str) -> list:
+        return [node for node in self.tree.css(f'[{attribute}]') if pattern.search(node.attributes.get(attribute) or '')]
+
+    def remove(self, tags: Sequence[str], pattern: Pattern, protected: Sequence[str]) -> None:
+        doomed = self.tree.css(', '.join(tags)) + self._matches(pattern, 'class') + self._matches(pattern, 'id')
+        protected_selector = ', '.join(protected)
+        doomed = [node for node in doomed if node.tag not in protected and node.css_first(protected_selector) is None]
+        doomed_ids = {node.mem_id for node in doomed}
+
+        # Decomposing frees a node's subtree, so only remove nodes with no doomed ancestor,
+        # and work that out before anything is freed
+        top = []
+        for node in doomed:
+            parent = node.parent
+            while parent is not None and parent.mem_id not in doomed_ids:
+                parent = parent.parent
+            if parent is None and node.mem_id not in {n.mem_id for n in top}:
+                top.append(node)
+        for node in top:
+            node.decompose()
+
+    def tag_texts(self, tag: str) -> List[str]:
+        return [node.text(separator=' ') for node in self.tree.css(tag)]
+
+    def pattern_texts(self, pattern: Pattern, tags: Sequence[str]) -> List[str]:
+        nodes = self._matches(pattern, 'class') + self._matches(pattern, 'id')
+        return [node.text(separator=' ') for node in nodes if node.tag in tags]
+
+    def main_text(self) -> str:
+        node = self.tree.css_first('main') or self.tree.body or self.tree.root
+        return node.text(separator=' ') if node else ''
+
+    def text(self) -> str:
+        return self.tree.root.text(separator=' ') if self.tree.root else ''
+
+BACKENDS = {
+    "selectolax": (SelectolaxDocument, LexborHTMLParser is not None),
+    "lxml": (LxmlDocument, lxml is not None),
+    "html.parser": (SoupDocument, True),
+}
+
+def available_backends() -> List[str]:
+    return [name for name in PREFERENCE if BACKENDS[name][1]]
+
+def backend_name(name: str = None) -> str:
+    """Configured backend, or the fastest installed one for 'auto' or an uninstalled choice"""
+    name = name or settings.html_parser
+    if name != "auto":
+        if name in BACKENDS and BACKENDS[name][1]:
+            return name
+        logger.warning(f"HTML parser backend '{name}' is not available, picking the fastest installed one")
+    return available_backends()[0]
+
+def parse_document(html: str, backend: str = None) -> Document:
+    return BACKENDS[backend_name(backend)][0](html)
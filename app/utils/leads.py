@@ -1,18 +1,26 @@
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional, Tuple
 import requests
-from bs4 import BeautifulSoup
 import logging
-import re
-from time import sleep
 from urllib.parse import urlparse
 from googlesearch import search
 import random
 from ..config import settings
-from groq import Groq
+from .parsing import ParsedPage, parse_pages
+from .scoring import build_profile, score_candidates
+from .fingerprint import SimHashIndex, canonicalize_url
+from ..domain_health import (
+    DomainUnavailable, domain_of, is_open, record_failure, record_success,
+    classify_exception, looks_like_bot_wall
+)
+from .llm import create_completion
+from ..replay import external_call, dump_response, load_response, replaying
+from ..accounting import CostLedger, charging, stage, split_time, record_bytes
+from ..deadline import call_timeout, expired, sleep_within
+from ..records import Candidate
+import time
 import json
 
 logger = logging.getLogger(__name__)
-groq_client = Groq()
 
 def get_random_user_agent():
     """Get a random user agent to avoid detection"""
@@ -75,7 +83,8 @@ Make the queries simple and direct, good for Google search.
 Format your response exactly like this:
 Query: [search query]"""
 
-        completion = groq_client.chat.completions.create(
+        completion = create_completion(
+            call_site="queries",
             model="llama-3.1-70b-versatile",
             messages=[{"role": "user", "content": prompt}],
             temperature=1,
@@ -117,8 +126,61 @@ def is_valid_url(url: str) -> bool:
     except:
         return False
 
-def get_company_info(url: str) -> Dict:
-    """Extract company information from website"""
+def fetch_page(url: str, timeout: float = None, headers: dict = None) -> requests.Response:
+    """GET a page with browser-like headers; extra headers (e.g. validators) override the defaults.
+    The timeout is cut to whatever is left of the current time budget."""
+    request_headers = {
+        'User-Agent': get_random_user_agent(),
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.5',
+        **(headers or {})
+    }
+    
+    # Don't spend a timeout on domains that recently failed
+    domain = domain_of(url)
+    if is_open(domain):
+        raise DomainUnavailable(f"{domain} is cooling down after repeated failures")
+    
+    default_timeout = timeout or settings.http_timeout_seconds
+    timeout = call_timeout(default_timeout)
+    try:
+        # Validators are part of the key: a conditional GET and a plain GET are different calls
+        key = {"url": url, "validators": [headers.get(name) for name in ('If-None-Match', 'If-Modified-Since')] if headers else None}
+        response = external_call(
+            "http", key,
+            lambda: requests.get(url, headers=request_headers, timeout=timeout),
+            dump_response, load_response, label=url
+        )
+        record_bytes(len(response.content))
+    except requests.RequestException as e:
+        # A timeout our own deadline shortened says nothing about the site, so it doesn't count against it
+        if timeout >= default_timeout:
+            record_failure(domain, classify_exception(e))
+        raise
+    
+    if response.status_code in (403, 429) or response.status_code >= 500:
+        retry_after = response.headers.get('Retry-After', '')
+        record_failure(domain, f"http_{response.status_code}", int(retry_after) if retry_after.isdigit() else None)
+    elif response.ok and looks_like_bot_wall(response):
+        record_failure(domain, "bot_wall")
+        raise DomainUnavailable(f"{domain} served a bot wall")
+    elif response.status_code < 400:
+        record_success(domain)
+    
+    response.raise_for_status()
+    return response
+
+def page_validators(response: requests.Response) -> Tuple[Optional[str], Optional[str]]:
+    """ETag and Last-Modified of a response, for revalidating the page later with a conditional GET"""
+    return response.headers.get('ETag'), response.headers.get('Last-Modified')
+
+def fetch_raw_page(url: str, timeout: float = None) -> Tuple[bytes, Optional[str]]:
+    """Download a page and return its raw bytes and declared encoding for parsing"""
+    response = fetch_page(url, timeout)
+    return response.content, response.encoding
+
+def get_company_info(url: str, page: ParsedPage = None) -> Dict:
+    """Extract company information from website, reusing an already parsed page if given"""
     try:
         if not is_valid_url(url):
             return None
@@ -126,33 +188,20 @@ def get_company_info(url: str) -> Dict:
         if not url.startswith(('http://', 'https://')):
             url = 'https://' + url
 
-        headers = {
-            'User-Agent': get_random_user_agent(),
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-        }
-        
-        response = requests.get(url, headers=headers, timeout=5)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
+        if page is None:
+            page = parse_pages([fetch_raw_page(url)])[0]
+            if page is None:
+                return None
         
         # Extract domain for fallback
         domain = urlparse(url).netloc.lower()
         domain = domain.replace('www.', '').split('.')[0]
         
-        # Extract text content and clean it
-        text_content = ' '.join(soup.get_text().split())[:2000]  # First 2000 chars, cleaned
+        # Densest page regions, already packed into the prompt token budget by the parser
+        text_content = page.summary
         
-        # Extract emails from the page
-        email_pattern = r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}'
-        emails = re.findall(email_pattern, response.text)
-        contact_emails = [
-            email for email in emails
-            if not any(x in email.lower() for x in ['noreply', 'no-reply', 'donotreply'])
-            and not email.startswith(('example', 'test', 'user', 'admin'))
-        ]
-        default_email = contact_emails[0] if contact_emails else f'contact@{domain}.com'
+        # Contact emails found on the page
+        default_email = page.emails[0] if page.emails else f'contact@{domain}.com'
         
         # Use Groq to extract company information
         prompt = f"""Extract company information from this website content. The response MUST be a valid JSON object.
@@ -174,7 +223,8 @@ Return ONLY a JSON object in this exact format:
     "company_description": "2-3 sentence description of what the company does"
 }}"""
 
-        completion = groq_client.chat.completions.create(
+        completion = create_completion(
+            call_site="extract",
             model="llama-3.1-70b-versatile",
             messages=[
                 {"role": "system", "content": "You are a JSON-only API that extracts company information from website content. Only return valid JSON, no other text."},
@@ -217,54 +267,202 @@ Return ONLY a JSON object in this exact format:
         logger.error(f"Error extracting company info from {url}: {str(e)}")
         return None
 
-def search_leads(keywords: List[str], icp: dict = None, product: dict = None) -> List[Dict]:
-    """Search for potential leads based on keywords and ICP"""
+def google_search(query: str, num_results: int = 10) -> List[str]:
+    timeout = call_timeout(settings.http_timeout_seconds)
+    return external_call(
+        "search", {"query": query, "num_results": num_results},
+        lambda: list(search(query, num_results=num_results, timeout=timeout)),
+        list, list, label=query
+    )
+
+def search_leads(keywords: List[str], icp: dict = None, product: dict = None,
+                 is_duplicate: Callable[[Optional[str], Optional[int]], bool] = None,
+                 queries: List[str] = None, stats: Dict[str, Dict[str, int]] = None,
+                 costs: Dict[str, CostLedger] = None, max_results: int = None) -> List[Candidate]:
+    """Search for potential leads based on keywords and ICP
+
+    is_duplicate(url, simhash) lets the caller reject sites it already knows about: it is
+    called with (url, None) before a page is fetched and with (None, simhash) after it is
+    parsed, to catch known content under a new URL. Pass planned queries to skip query
+    generation; per-query result and filter counts are written into stats, and a
+    cost ledger per candidate URL into costs (rejected candidates get their outcome here).
+    No more than max_results candidates (default max_leads_per_run) are extracted.
+    """
+    costs = costs if costs is not None else {}
+    max_results = settings.max_leads_per_run if max_results is None else max_results
     try:
-        # Generate search queries
-        search_queries = generate_search_queries(keywords, icp, product)
+        # Generate search queries unless the caller planned them
+        search_queries = queries if queries is not None else generate_search_queries(keywords, icp, product)
         logger.info(f"Using search queries: {search_queries}")
         
         results = []
-        seen_urls = set()
+        seen_urls = {}  # canonical URL -> query that found it first
+        seen_content = SimHashIndex(settings.near_duplicate_max_distance)
+        content_queries = {}  # simhash -> query that found it first
+        profile = build_profile(icp, product)
         
         for query in search_queries:
+            if expired():
+                logger.info("Time budget used up, skipping the remaining search queries")
+                break
             try:
                 # Use Google Search API to find companies
-                for url in search(query, num_results=10):
-                    if url in seen_urls:
+                # claimed counts results an earlier query already found this run, so the ledger doesn't blame this one
+                query_stats = {"results": 0, "passed_filter": 0, "claimed": 0}
+                if stats is not None:
+                    stats[query] = query_stats
+                
+                urls = []
+                with stage("search"):
+                    found = google_search(query, num_results=10)
+                for url in found:
+                    query_stats["results"] += 1
+                    canonical = canonicalize_url(url)
+                    if url in costs:
+                        if costs[url].source_query != query:
+                            query_stats["claimed"] += 1
+                        continue  # Already accounted for under another query
+                    costs[url] = CostLedger(url, query)
+                    if canonical in seen_urls:
+                        if seen_urls[canonical] != query:
+                            query_stats["claimed"] += 1
+                        costs[url].finish("duplicate", "same_url")
+                    else:
+                        seen_urls[canonical] = query
+                        urls.append(url)
+                
+                # Domain and path checks don't need the page, so skip obvious non-company URLs before fetching
+                for url in urls:
+                    if not is_company_website(url, ''):
+                        costs[url].finish("filtered", "not_company")
+                urls = [url for url in urls if costs[url].outcome is None]
+                
+                # Skip domains whose circuit breaker is open without logging each one as an error
+                blocked = [url for url in urls if is_open(domain_of(url))]
+                if blocked:
+                    logger.info(f"Skipping {len(blocked)} URLs on cooling-down domains")
+                    for url in blocked:
+                        costs[url].finish("failed", "domain_open")
+                    urls = [url for url in urls if url not in blocked]
+                
+                # Known leads by exact or canonical URL cost nothing more; only new sites are downloaded
+                if is_duplicate:
+                    for url in urls:
+                        if is_duplicate(url, None):
+                            logger.info(f"Skipping {url}: already a lead")
+                            costs[url].finish("duplicate", "known_lead")
+                    urls = [url for url in urls if costs[url].outcome is None]
+                
+                # Download pages; parsing happens below in the process pool
+                fetched = []
+                validators = {}  # url -> (etag, last_modified), handed to the candidate with the page summary
+                for url in urls:
+                    if expired():
+                        costs[url].finish("failed", "deadline")
                         continue
-                    
                     try:
-                        # Get page title to check if it's a company website
-                        headers = {'User-Agent': get_random_user_agent()}
-                        response = requests.get(url, headers=headers, timeout=5)
-                        soup = BeautifulSoup(response.text, 'html.parser')
-                        title = soup.title.string if soup.title else ''
-                        
-                        if not is_company_website(url, title):
+                        with charging(costs[url]), stage("fetch"):
+                            response = fetch_page(url)
+                        fetched.append((url, (response.content, response.encoding)))
+                        validators[url] = page_validators(response)
+                    except Exception as e:
+                        costs[url].finish("failed", "fetch_error")
+                        logger.error(f"Error fetching URL {url}: {str(e)}")
+                
+                started = time.monotonic()
+                pages = parse_pages([raw for _, raw in fetched])
+                split_time([costs[url] for url, _ in fetched], "parse", time.monotonic() - started)
+                
+                # Use page title to check if it's a company website, then drop near-duplicates
+                candidates = []
+                for (url, _), page in zip(fetched, pages):
+                    if page is None:
+                        costs[url].finish("failed", "parse_error")
+                        continue
+                    if not is_company_website(url, page.title):
+                        costs[url].finish("filtered", "title")
+                        continue
+                    match = seen_content.find(page.simhash) if page.simhash is not None else None
+                    if match is not None:
+                        logger.info(f"Skipping {url}: same content as a site already found this run")
+                        if content_queries[match] != query:
+                            query_stats["claimed"] += 1
+                        costs[url].finish("duplicate", "same_content")
+                        continue
+                    if is_duplicate and page.simhash is not None and is_duplicate(None, page.simhash):
+                        logger.info(f"Skipping {url}: same content as an existing lead")
+                        costs[url].finish("duplicate", "known_lead")
+                        continue
+                    if page.simhash is not None:
+                        seen_content.add(page.simhash)
+                        content_queries[page.simhash] = query
+                    candidates.append((url, page))
+                
+                # Score all candidates locally in one batch so only relevant sites reach Groq
+                started = time.monotonic()
+                scores = score_candidates([page.text for _, page in candidates], profile)
+                split_time([costs[url] for url, _ in candidates], "score", time.monotonic() - started)
+                
+                for (url, page), score in zip(candidates, scores):
+                    try:
+                        if len(results) >= max_results:
+                            costs[url].finish("filtered", "lead_limit")
+                            continue
+                        if expired():
+                            costs[url].finish("failed", "deadline")
+                            continue
+                        if score < settings.min_relevance_score:
+                            logger.info(f"Skipping {url}: relevance score {score} below {settings.min_relevance_score}")
+                            costs[url].finish("filtered", "low_relevance")
                             continue
                             
+                        query_stats["passed_filter"] += 1
+                        
                         # Extract company information
-                        company_info = get_company_info(url)
-                        if company_info and all(k in company_info for k in ['company_name', 'lead_name', 'company_website', 'lead_email']):
-                            results.append(company_info)
-                            seen_urls.add(url)
+                        with charging(costs[url]), stage("extract"):
+                            company_info = get_company_info(url, page=page)
+                        candidate = None
+                        if company_info:
+                            try:
+                                candidate = Candidate(
+                                    url,
+                                    company_info.get('company_name'),
+                                    company_info.get('lead_name'),
+                                    company_info.get('lead_email'),
+                                    company_info.get('company_description'),
+                                    relevance_score=score,
+                                    content_simhash=page.simhash,
+                                    source_query=query,
+                                    summary=page.summary,
+                                    etag=validators[url][0],
+                                    last_modified=validators[url][1]
+                                )
+                            except ValueError as e:
+                                logger.warning(f"Discarding extracted info for {url}: {str(e)}")
+                        if candidate is not None:
+                            results.append(candidate)
                             
                             # Log found company
-                            logger.info(f"Found company: {company_info['company_name']}")
+                            logger.info(f"Found company: {candidate.company_name}")
+                        else:
+                            costs[url].finish("failed", "extract_failed")
                             
                     except Exception as e:
+                        costs[url].finish("failed", "error")
                         logger.error(f"Error processing URL {url}: {str(e)}")
                         continue
                         
-                    # Respect rate limits
-                    sleep(2)
+                    # Respect rate limits (nothing to be polite to when replaying)
+                    if not replaying():
+                        sleep_within(2)
                     
             except Exception as e:
                 logger.error(f"Error processing query '{query}': {str(e)}")
+                if stats is not None and query in stats:
+                    stats[query]["error"] = 1  # Tells a broken run apart from one that found nothing
                 continue
                 
-            if len(results) >= 10:  # Limit to 10 leads per run
+            if len(results) >= max_results:
                 break
                 
         return results
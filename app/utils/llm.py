@@ -0,0 +1,42 @@
+import types
+from groq import Groq
+from ..config import settings
+from ..replay import external_call
+from ..accounting import record_usage
+from ..deadline import call_timeout, remaining
+
+groq_client = Groq(api_key=settings.groq_api_key or None)
+
+def dump_completion(completion) -> dict:
+    usage = getattr(completion, "usage", None)
+    return {
+        "content": completion.choices[0].message.content,
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0),
+        "completion_tokens": getattr(usage, "completion_tokens", 0)
+    }
+
+def load_completion(data: dict):
+    """Minimal stand-in exposing the attributes callers read from a Groq completion"""
+    message = types.SimpleNamespace(content=data["content"])
+    usage = types.SimpleNamespace(
+        prompt_tokens=data["prompt_tokens"],
+        completion_tokens=data["completion_tokens"],
+        total_tokens=data["prompt_tokens"] + data["completion_tokens"]
+    )
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=usage)
+
+def create_completion(call_site: str = "other", **params):
+    """Groq chat completion; every LLM call in the app goes through here so runs can be recorded,
+    replayed and charged to the current cost ledger under call_site"""
+    key = {"model": params.get("model"), "messages": params.get("messages")}
+    timeout = call_timeout(settings.llm_timeout_seconds)
+    # Under a time budget a retry would overrun it, so the client's automatic retries are off
+    client = groq_client if remaining() is None else groq_client.with_options(max_retries=0)
+    completion = external_call(
+        "llm", key,
+        lambda: client.chat.completions.create(**params, timeout=timeout),
+        dump_completion, load_completion,
+        label=params.get("model", "")
+    )
+    record_usage(call_site, completion)
+    return completion
@@ -0,0 +1,195 @@
+from typing import List, NamedTuple, Optional, Tuple
+from concurrent.futures import CancelledError, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import logging
+import multiprocessing
+import os
+import re
+import signal
+import threading
+from ..config import settings
+from ..deadline import remaining
+from .fingerprint import simhash
+from .content import clean, extract_regions, select_content
+from .html_backends import parse_document
+
+logger = logging.getLogger(__name__)
+
+EMAIL_PATTERN = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+class ParsedPage(NamedTuple):
+    """Compact result of parsing one page, cheap to send back from a worker process"""
+    title: str
+    text: str  # Visible text with scripts/styles removed and whitespace collapsed
+    emails: List[str]  # Contact emails found in the raw HTML, in page order
+    simhash: Optional[int]  # Content fingerprint for near-duplicate detection
+    summary: str  # Best page regions packed into the prompt token budget, for LLM prompts
+
+def extract_emails(html: str) -> List[str]:
+    """Find contact emails in raw HTML, skipping no-reply and placeholder addresses"""
+    emails = []
+    for email in EMAIL_PATTERN.findall(html):
+        if any(x in email.lower() for x in ['noreply', 'no-reply', 'donotreply']):
+            continue
+        if email.startswith(('example', 'test', 'user', 'admin')):
+            continue
+        if email not in emails:
+            emails.append(email)
+    return emails
+
+def parse_html(raw: bytes, encoding: Optional[str] = None, backend: Optional[str] = None) -> ParsedPage:
+    """Parse raw HTML bytes into title, visible text, contact emails, fingerprint and prompt summary"""
+    html = raw.decode(encoding or 'utf-8', errors='replace')
+    doc = parse_document(html, backend)
+
+    title = clean(doc.title())
+
+    # Reads JSON-LD and meta tags, then strips scripts, styles and boilerplate from the tree
+    regions = extract_regions(doc)
+
+    text = clean(doc.text())
+    return ParsedPage(
+        title=title,
+        text=text,
+        emails=extract_emails(html),
+        simhash=simhash(text),
+        summary=select_content(regions, settings.prompt_token_budget)
+    )
+
+def _parse_or_none(raw: bytes, encoding: Optional[str]) -> Optional[ParsedPage]:
+    try:
+        return parse_html(raw, encoding)
+    except Exception as e:
+        logger.error(f"Error parsing page: {str(e)}")
+        return None
+
+def _report_pid(pids) -> None:
+    """Worker initializer: tell the parent which process this is"""
+    pids.put(os.getpid())
+
+class ParsePool(ProcessPoolExecutor):
+    """A process pool that knows its workers' pids and its outstanding futures, so it can be retired safely"""
+
+    def __init__(self, max_workers: int, mp_context):
+        self.pids = mp_context.SimpleQueue()
+        self.pending = set()
+        self.abandoned = set()  # Futures whose caller gave up on them
+        self.pending_lock = threading.Lock()
+        super().__init__(max_workers=max_workers, mp_context=mp_context, initializer=_report_pid, initargs=(self.pids,))
+
+    def submit(self, fn, *args, **kwargs):
+        future = super().submit(fn, *args, **kwargs)
+        with self.pending_lock:
+            self.pending.add(future)
+        future.add_done_callback(self._forget)
+        return future
+
+    def _forget(self, future) -> None:
+        with self.pending_lock:
+            self.pending.discard(future)
+            self.abandoned.discard(future)
+
+    def abandon(self, futures) -> bool:
+        """Cancel these futures, or stop caring about those already running; True if any were running"""
+        running = False
+        for future in futures:
+            if not future.cancel():
+                with self.pending_lock:
+                    if future in self.pending:
+                        self.abandoned.add(future)
+                        running = True
+        return running
+
+    def others_pending(self) -> set:
+        with self.pending_lock:
+            return self.pending - self.abandoned
+
+    def stop_workers(self) -> None:
+        """Terminate every worker this pool started; only call once nothing else is waiting on it"""
+        while not self.pids.empty():
+            try:
+                os.kill(self.pids.get(), signal.SIGTERM)
+            except OSError:
+                pass  # Already exited
+
+def get_parse_pool() -> Optional[ParsePool]:
+    """Shared process pool for parsing, or None when parsing runs inline"""
+    global _pool
+    if settings.parse_workers <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # The pool starts lazily from a user thread while the writer and scheduler threads hold locks;
+            # forking then could hand a worker a lock that is never released, so start workers fresh
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ParsePool(settings.parse_workers, multiprocessing.get_context(method))
+        return _pool
+
+def _drain_and_stop(pool: ParsePool) -> None:
+    """Let other callers' batches finish on a retired pool, then stop workers still stuck on abandoned pages"""
+    while True:
+        others = pool.others_pending()
+        if not others:
+            break
+        wait(others)
+    pool.shutdown(wait=False, cancel_futures=True)
+    pool.stop_workers()
+
+def retire_parse_pool(pool: ParsePool) -> None:
+    """Give new batches a fresh pool and stop this one once the batches already on it are done"""
+    global _pool
+    with _pool_lock:
+        if _pool is not pool:
+            return  # Another caller already retired it
+        _pool = None
+    threading.Thread(target=_drain_and_stop, args=(pool,), name="parse-pool-retire", daemon=True).start()
+
+def shutdown_parse_pool() -> None:
+    """Stop the pool at exit"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+def parse_timeout() -> float:
+    """How long to wait for a batch: parse_timeout_seconds, cut to what is left of the time budget"""
+    left = remaining()
+    return settings.parse_timeout_seconds if left is None else max(0.0, min(settings.parse_timeout_seconds, left))
+
+def _parse_chunk(raws: List[bytes], encodings: List[Optional[str]]) -> List[Optional[ParsedPage]]:
+    return [_parse_or_none(raw, encoding) for raw, encoding in zip(raws, encodings)]
+
+def parse_pages(pages: List[Tuple[bytes, Optional[str]]]) -> List[Optional[ParsedPage]]:
+    """Parse (raw bytes, encoding) pairs across the process pool, preserving order"""
+    if not pages:
+        return []
+
+    pool = get_parse_pool()
+    if pool is None:
+        return [_parse_or_none(raw, encoding) for raw, encoding in pages]
+
+    size = max(1, settings.parse_chunk_size)
+    chunks = [pages[i:i + size] for i in range(0, len(pages), size)]
+    try:
+        futures = [pool.submit(_parse_chunk, [raw for raw, _ in chunk], [encoding for _, encoding in chunk]) for chunk in chunks]
+        done, not_done = wait(futures, timeout=parse_timeout())
+        if not_done:
+            # Don't let a stuck worker hold the run past its deadline; only this batch's pages count as failed
+            logger.error(f"Parsing timed out with {len(not_done)} of {len(chunks)} chunks unfinished")
+            if pool.abandon(not_done):
+                # A worker may be stuck on one of our pages; other callers keep the old pool until their batches finish
+                retire_parse_pool(pool)
+        results = []
+        for chunk, future in zip(chunks, futures):
+            results.extend(future.result() if future in done else [None] * len(chunk))
+        return results
+    except (BrokenProcessPool, CancelledError, RuntimeError) as e:
+        # A worker died (e.g. OOM on a huge page) or the pool was retired under us; parse inline now
+        logger.error(f"Parse pool unavailable, parsing inline: {str(e)}")
+        if isinstance(e, BrokenProcessPool):
+            retire_parse_pool(pool)
+        return [_parse_or_none(raw, encoding) for raw, encoding in pages]
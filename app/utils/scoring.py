@@ -0,0 +1,71 @@
+from typing import List
+import logging
+import re
+import zlib
+import numpy as np
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Common English words plus boilerplate that appears on nearly every website
+STOP_WORDS = frozenset("""
+a about above after all also an and any are as at be been before being below between both but by can could did do
+does doing down during each few for from further had has have having he her here hers him his how i if in into is it
+its just me more most my no nor not now of off on once only or other our ours out over own same she should so some
+such than that the their them then there these they this those through to too under until up very was we were what
+when where which while who whom why will with would you your yours
+home menu cookie cookies privacy policy terms login sign contact us copyright rights reserved read more learn click
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word unigrams and bigrams with stop words removed"""
+    words = [w for w in TOKEN_PATTERN.findall(text.lower()) if len(w) > 2 and w not in STOP_WORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+def hashed_counts(texts: List[str], n_features: int) -> np.ndarray:
+    """Term counts for each text, hashed into a fixed number of columns"""
+    rows = []
+    cols = []
+    for row, text in enumerate(texts):
+        # crc32 rather than hash() so features are stable across processes
+        features = [zlib.crc32(term.encode()) % n_features for term in tokenize(text)]
+        rows.extend([row] * len(features))
+        cols.extend(features)
+
+    counts = np.zeros((len(texts), n_features), dtype=np.float32)
+    np.add.at(counts, (np.array(rows, dtype=np.intp), np.array(cols, dtype=np.intp)), 1)
+    return counts
+
+def build_profile(icp: dict, product: dict) -> str:
+    """Text describing what a good lead looks like for this user"""
+    if not icp or not product:
+        return ""
+    parts = [product.get('name', ''), product.get('description', '')]
+    parts += icp.get('target_pain_points') or []
+    parts += icp.get('target_industries') or []
+    return ' '.join(p for p in parts if p)
+
+def score_candidates(texts: List[str], profile: str) -> List[int]:
+    """Score each text 0-100 by cosine similarity of hashed term vectors to the profile.
+
+    No IDF: weights fitted on the batch would make a page's score depend on the pages scored with it.
+    """
+    if not texts:
+        return []
+    if not profile:
+        return [100] * len(texts)  # Nothing to compare against, don't gate
+
+    counts = hashed_counts([profile] + texts, settings.relevance_hash_features)
+
+    # Sublinear TF, so a term repeated all over one page doesn't swamp the rest
+    weights = np.log1p(counts)
+
+    norms = np.linalg.norm(weights, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    weights /= norms
+
+    similarities = weights[1:] @ weights[0]
+    scores = np.clip(similarities / settings.relevance_similarity_scale, 0, 1) * 100
+    return [int(round(s)) for s in scores]
@@ -5,7 +5,13 @@ from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.executors.pool import ProcessPoolExecutor
 from app.database import init_db, SessionLocal
 from app.config import Settings
-from app.cron_job import run_prospecting_job
+from app.scheduling import dispatch_due_users, shutdown_scheduler, sync_user_leases
+from app.research_refresh import refresh_due_research
+from app.retention import run_retention
+from app.db_writer import close_writer
+from app.replay import close_archive
+from app.utils.parsing import shutdown_parse_pool
+from app.sharding import WORKER_ID, release_all, prune_dead_workers
 from app.onboarding import collect_company_info, save_to_db
 from app.models import User
 
@@ -53,25 +59,50 @@ def main():
         timezone='UTC'
     )
 
-    @scheduler.scheduled_job('interval', minutes=settings.search_interval_minutes)
-    def scheduled_job():
+    # Each user has its own next-run time; this tick only hands due users to the run pool,
+    # so a slow user never delays the others
+    @scheduler.scheduled_job('interval', seconds=settings.scheduler_tick_seconds, coalesce=True)
+    def dispatch_job():
         try:
-            logger.info("Running prospecting job...")
-            run_prospecting_job()
-            logger.info("Prospecting job completed")
+            dispatch_due_users()
         except Exception as e:
-            logger.error(f"Error in prospecting job: {str(e)}")
+            logger.error(f"Error dispatching users: {str(e)}")
+
+    @scheduler.scheduled_job('interval', seconds=settings.heartbeat_interval_seconds)
+    def heartbeat_job():
+        # Keep our leases alive and pick up users from workers that died or left
+        sync_user_leases()
+        prune_dead_workers()
+
+    @scheduler.scheduled_job('interval', minutes=settings.research_refresh_interval_minutes)
+    def research_refresh_job():
+        # Cheap conditional GETs; the LLM only runs for sites whose text changed
+        refresh_due_research()
+
+    @scheduler.scheduled_job('interval', hours=settings.retention_interval_hours)
+    def retention_job():
+        # Archive superseded research versions, compress large payloads and reclaim space
+        run_retention()
+
+    # Claim our share of users before the first run
+    sync_user_leases()
 
     # Set up signal handlers
     signal.signal(signal.SIGTERM, signal_handler)
     signal.signal(signal.SIGINT, signal_handler)
 
     try:
-        logger.info(f"Sales Bot is running! We'll check for new leads every {settings.search_interval_minutes} minutes.")
+        logger.info(f"Sales Bot worker {WORKER_ID} is running! Users are checked for new leads about every {settings.search_interval_minutes} minutes, {settings.max_concurrent_users} at a time.")
         logger.info("Press Ctrl+C to exit")
         scheduler.start()
     except (KeyboardInterrupt, SystemExit):
         scheduler.shutdown()
+        # Let in-flight runs finish before other workers may take their users
+        shutdown_scheduler(wait=True)
+        release_all()
+        shutdown_parse_pool()
+        close_writer()
+        close_archive()
         logger.info("Shutting down Sales Bot")
 
 if __name__ == "__main__":